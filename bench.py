@@ -0,0 +1,225 @@
+# Benchmarks of every cryptographic stage, with regression tracking.
+#
+#   python bench.py                                 # run everything, print a JSON report
+#   python bench.py --output baseline.json          # save a report
+#   python bench.py --compare baseline.json         # flag regressions against a saved report
+#   python bench.py --stages commit_to_poly --sizes 128 4096 --repeat 10
+#
+# Every stage is timed `repeat` times after `warmup` untimed runs (which fill the caches, e.g. the
+# fixed-base MSM tables), and reported as median and percentiles in seconds.
+
+import argparse, json, platform, random, statistics, sys, time
+
+from py_ecc import optimized_bls12_381 as b
+
+import params
+import trusted_setup
+from fk20 import compute_all_multiproofs
+from imported.fft import ntt
+from imported.kzg_proofs import get_root_of_unity, div_polys, commit_to_poly, commit_to_evaluations, get_lagrange_setup, compute_proof_multi, check_proof_multi
+from msm import lincomb
+from sharding import BlobsMatrix
+from trusted_setup import SETUP
+import util
+
+MODULUS = b.curve_order
+
+DEFAULT_SIZES = [16, 128, 1024]
+DEFAULT_THRESHOLD = 0.10
+
+
+def random_polynomial(n):
+    return [random.randrange(MODULUS) for _ in range(n)]
+
+# Each stage takes a size and returns the function to time, with its inputs prepared up front
+
+def stage_setup_load(n):
+    def run():
+        with trusted_setup.open_binary_setup() as setup:
+            setup[0][:n]
+            setup[1][n]
+    return run
+
+def stage_lincomb(n):
+    points = SETUP[0][:n]
+    scalars = random_polynomial(n)
+    return lambda: lincomb(points, scalars)
+
+def stage_fft(n):
+    vals = random_polynomial(n)
+    root_of_unity = get_root_of_unity(n)
+    return lambda: ntt(list(vals), MODULUS, root_of_unity)
+
+def stage_inverse_fft(n):
+    vals = random_polynomial(n)
+    root_of_unity = get_root_of_unity(n)
+    return lambda: ntt(list(vals), MODULUS, root_of_unity, inv=True)
+
+def stage_div_polys(n):
+    polynomial = random_polynomial(n)
+    n_openings = params.FIELD_ELEMENTS_PER_SAMPLE
+    divisor = [MODULUS - random.randrange(MODULUS)] + [0] * (n_openings - 1) + [1]
+    return lambda: div_polys(polynomial, divisor)
+
+def stage_commit_to_poly(n):
+    polynomial = random_polynomial(n)
+    return lambda: commit_to_poly(polynomial, SETUP)
+
+def stage_commit_to_evaluations(n):
+    evaluations = random_polynomial(n)
+    # The Lagrange form of the setup is built once per size, outside of the timings
+    get_lagrange_setup(SETUP, n)
+    return lambda: commit_to_evaluations(evaluations, SETUP)
+
+def stage_compute_proof_multi(n):
+    polynomial = random_polynomial(n)
+    n_openings = params.FIELD_ELEMENTS_PER_SAMPLE
+    x = util.get_coset_factor(0, n_openings)
+    return lambda: compute_proof_multi(polynomial, x, n_openings, SETUP)
+
+def stage_compute_all_multiproofs(n):
+    polynomial = random_polynomial(n)
+    return lambda: compute_all_multiproofs(polynomial, params.FIELD_ELEMENTS_PER_SAMPLE)
+
+def stage_check_proof_multi(n):
+    polynomial = random_polynomial(n)
+    n_openings = params.FIELD_ELEMENTS_PER_SAMPLE
+    x = util.get_coset_factor(1, n_openings)
+    commitment = commit_to_poly(polynomial, SETUP)
+    proof = compute_proof_multi(polynomial, x, n_openings, SETUP)
+    root_of_unity = get_root_of_unity(n_openings)
+    ys = [sum(c * pow(x * pow(root_of_unity, i, MODULUS), j, MODULUS) for j, c in enumerate(polynomial)) % MODULUS
+          for i in range(n_openings)]
+    def run():
+        assert check_proof_multi(commitment, proof, x, ys, SETUP)
+    return run
+
+def stage_matrix(n):
+    # A matrix of blobs of n field elements
+    if n < params.FIELD_ELEMENTS_PER_SAMPLE:
+        return None
+    return lambda: BlobsMatrix(n_columns=n // params.FIELD_ELEMENTS_PER_SAMPLE)
+
+def stage_lazy_matrix(n):
+    if n < params.FIELD_ELEMENTS_PER_SAMPLE:
+        return None
+    return lambda: BlobsMatrix(n_columns=n // params.FIELD_ELEMENTS_PER_SAMPLE, lazy=True).get_random_sample()
+
+STAGES = {
+    'setup_load': stage_setup_load,
+    'lincomb': stage_lincomb,
+    'fft': stage_fft,
+    'inverse_fft': stage_inverse_fft,
+    'div_polys': stage_div_polys,
+    'commit_to_poly': stage_commit_to_poly,
+    'commit_to_evaluations': stage_commit_to_evaluations,
+    'compute_proof_multi': stage_compute_proof_multi,
+    'compute_all_multiproofs': stage_compute_all_multiproofs,
+    'check_proof_multi': stage_check_proof_multi,
+    'matrix': stage_matrix,
+    'lazy_matrix': stage_lazy_matrix,
+}
+
+
+def percentile(sorted_times, q):
+    """Linearly interpolated q-th percentile of a sorted list"""
+    position = (len(sorted_times) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_times) - 1)
+    return sorted_times[lower] + (sorted_times[upper] - sorted_times[lower]) * (position - lower)
+
+
+def time_function(run, repeat, warmup):
+    for _ in range(warmup):
+        run()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {
+        'repeat': repeat,
+        'warmup': warmup,
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+        'min': times[0],
+        'max': times[-1],
+        'p10': percentile(times, 10),
+        'p90': percentile(times, 90),
+        'p99': percentile(times, 99),
+    }
+
+
+def run_benchmarks(stages, sizes, repeat, warmup):
+    results = {}
+    for stage in stages:
+        for n in sizes:
+            run = STAGES[stage](n)
+            if run is None:
+                continue
+            key = '%s/%d' % (stage, n)
+            results[key] = time_function(run, repeat, warmup)
+            print("%-32s median %9.4fs  p90 %9.4fs" % (key, results[key]['median'], results[key]['p90']), file=sys.stderr)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """
+    Compare the medians of two reports. Returns the keys that got slower by more than `threshold`
+    (a fraction, e.g. 0.1 for 10%).
+    """
+    regressions = []
+    for key, result in sorted(report['results'].items()):
+        if key not in baseline['results']:
+            continue
+        ratio = result['median'] / baseline['results'][key]['median']
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions.append(key)
+            flag = 'REGRESSION'
+        elif ratio < 1 - threshold:
+            flag = 'improved'
+        print("%-32s %9.4fs -> %9.4fs  %6.2fx  %s" % (key, baseline['results'][key]['median'], result['median'], ratio, flag),
+              file=sys.stderr)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every cryptographic stage")
+    parser.add_argument('--stages', nargs='+', choices=sorted(STAGES), default=list(STAGES))
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES + [params.FIELD_ELEMENTS_PER_BLOB])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--output', help="write the JSON report to this file instead of stdout")
+    parser.add_argument('--compare', help="baseline JSON report to check for regressions")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="slowdown of the median, as a fraction, counted as a regression")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.stages, sorted(set(args.sizes)), args.repeat, args.warmup)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print("%d regressions: %s" % (len(regressions), ', '.join(regressions)), file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
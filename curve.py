@@ -0,0 +1,274 @@
+# G1 arithmetic on plain integers, for the hot loops of MSMs and FFTs.
+#
+# Points are Jacobian (X, Y, Z) tuples of ints, standing for the affine point (X / Z^2, Y / Z^3);
+# Z = 0 is the point at infinity. A point with Z = 1 is affine, and adding an affine point uses the
+# cheaper mixed addition formulas, so bases are kept affine and tables of intermediate points are
+# brought back to affine form with batch_normalize(), which costs a single field inversion.
+#
+# py_ecc's optimized_bls12_381 points (homogeneous projective FQ triples) convert to and from this
+# form without inversions. Formulas from the Explicit-Formulas Database, for a = 0.
+
+from py_ecc import optimized_bls12_381 as b
+
+P = b.field_modulus
+
+INFINITY = (1, 1, 0)
+
+
+def from_py_ecc(point):
+    """Jacobian point from a py_ecc point (x = X / Z, y = Y / Z)"""
+    x, y, z = point[0].n, point[1].n, point[2].n
+    if z == 0:
+        return INFINITY
+    if z == 1:
+        return (x, y, 1)
+    return (x * z % P, y * z * z % P, z)
+
+
+def to_py_ecc(point):
+    x, y, z = point
+    if z == 0:
+        return b.Z1
+    if z == 1:
+        return (b.FQ(x), b.FQ(y), b.FQ.one())
+    return (b.FQ(x * z % P), b.FQ(y), b.FQ(z * z * z % P))
+
+
+def is_inf(point):
+    return point[2] == 0
+
+
+def neg(point):
+    x, y, z = point
+    return (x, -y % P, z)
+
+
+def double(point):
+    """dbl-2009-l"""
+    x1, y1, z1 = point
+    if z1 == 0 or y1 == 0:
+        return INFINITY
+    a = x1 * x1 % P
+    b_ = y1 * y1 % P
+    c = b_ * b_ % P
+    d = 2 * ((x1 + b_) ** 2 - a - c) % P
+    e = 3 * a % P
+    x3 = (e * e - 2 * d) % P
+    y3 = (e * (d - x3) - 8 * c) % P
+    z3 = 2 * y1 * z1 % P
+    return (x3, y3, z3)
+
+
+def add(p1, p2):
+    """Sum of two points, with mixed addition if either one is affine"""
+    x1, y1, z1 = p1
+    x2, y2, z2 = p2
+    if z1 == 0:
+        return p2
+    if z2 == 0:
+        return p1
+    if z1 == 1 and z2 != 1:
+        x1, y1, z1, x2, y2, z2 = x2, y2, z2, x1, y1, z1
+
+    if z2 == 1:
+        # madd-2007-bl
+        z1z1 = z1 * z1 % P
+        u1, s1 = x1, y1
+        u2 = x2 * z1z1 % P
+        s2 = y2 * z1 * z1z1 % P
+    else:
+        # add-2007-bl
+        z1z1 = z1 * z1 % P
+        z2z2 = z2 * z2 % P
+        u1 = x1 * z2z2 % P
+        u2 = x2 * z1z1 % P
+        s1 = y1 * z2 * z2z2 % P
+        s2 = y2 * z1 * z1z1 % P
+    h = (u2 - u1) % P
+    r = 2 * (s2 - s1) % P
+    if h == 0:
+        if r == 0:
+            return double(p1)
+        return INFINITY
+    i = 4 * h * h % P
+    j = h * i % P
+    v = u1 * i % P
+    x3 = (r * r - j - 2 * v) % P
+    y3 = (r * (v - x3) - 2 * s1 * j) % P
+    if z2 == 1:
+        z3 = 2 * z1 * h % P
+    else:
+        z3 = 2 * z1 * z2 * h % P
+    return (x3, y3, z3)
+
+
+def multiply(point, n):
+    """Scalar multiplication by double-and-add (mixed additions if `point` is affine)"""
+    n %= b.curve_order
+    o = INFINITY
+    for bit in bin(n)[2:]:
+        o = double(o)
+        if bit == '1':
+            o = add(o, point)
+    return o
+
+
+def batch_normalize(points):
+    """
+    The same points, all affine (Z = 1, or the point at infinity), using one field inversion for
+    all of them (Montgomery's trick)
+    """
+    prefix = [1] * (len(points) + 1)
+    for i, (_, _, z) in enumerate(points):
+        prefix[i + 1] = prefix[i] * z % P if z > 1 else prefix[i]
+    inv_acc = pow(prefix[-1], -1, P)
+    o = [None] * len(points)
+    for i in range(len(points) - 1, -1, -1):
+        x, y, z = points[i]
+        if z <= 1:
+            o[i] = points[i] if z == 1 else INFINITY
+            continue
+        z_inv = prefix[i] * inv_acc % P
+        inv_acc = inv_acc * z % P
+        z_inv2 = z_inv * z_inv % P
+        o[i] = (x * z_inv2 % P, y * z_inv2 * z_inv % P, 1)
+    return o
+
+
+def eq(p1, p2):
+    x1, y1, z1 = p1
+    x2, y2, z2 = p2
+    if z1 == 0 or z2 == 0:
+        return z1 == z2
+    z1z1, z2z2 = z1 * z1 % P, z2 * z2 % P
+    return (x1 * z2z2 - x2 * z1z1) % P == 0 and (y1 * z2z2 * z2 - y2 * z1z1 * z1) % P == 0
+
+
+def batch_from_py_ecc(points):
+    """Affine points from py_ecc points (most of which, like setup points, already have z = 1)"""
+    return batch_normalize([from_py_ecc(point) for point in points])
+
+
+# G2 points: the same Jacobian formulas over FQ2 = FQ[u] / (u^2 + 1), with elements as (c0, c1)
+# pairs of ints. Only what bulk setup generation needs.
+
+F2_ZERO = (0, 0)
+F2_ONE = (1, 0)
+G2_INFINITY = (F2_ONE, F2_ONE, F2_ZERO)
+
+
+def _f2_mul(a, c):
+    a0, a1 = a
+    c0, c1 = c
+    t0 = a0 * c0
+    t1 = a1 * c1
+    return ((t0 - t1) % P, ((a0 + a1) * (c0 + c1) - t0 - t1) % P)
+
+
+def _f2_sqr(a):
+    a0, a1 = a
+    return ((a0 + a1) * (a0 - a1) % P, 2 * a0 * a1 % P)
+
+
+def _f2_inv(a):
+    a0, a1 = a
+    t = pow(a0 * a0 + a1 * a1, -1, P)
+    return (a0 * t % P, -a1 * t % P)
+
+
+def g2_from_py_ecc(point):
+    x, y, z = point[0].coeffs, point[1].coeffs, point[2].coeffs
+    if z == F2_ZERO:
+        return G2_INFINITY
+    if z == F2_ONE:
+        return (tuple(x), tuple(y), F2_ONE)
+    return (_f2_mul(x, z), _f2_mul(y, _f2_sqr(z)), tuple(z))
+
+
+def g2_to_py_ecc(point):
+    x, y, z = point
+    if z == F2_ZERO:
+        return b.Z2
+    if z == F2_ONE:
+        return (b.FQ2(x), b.FQ2(y), b.FQ2.one())
+    return (b.FQ2(_f2_mul(x, z)), b.FQ2(y), b.FQ2(_f2_mul(z, _f2_sqr(z))))
+
+
+def g2_double(point):
+    x1, y1, z1 = point
+    if z1 == F2_ZERO or y1 == F2_ZERO:
+        return G2_INFINITY
+    a = _f2_sqr(x1)
+    b_ = _f2_sqr(y1)
+    c = _f2_sqr(b_)
+    t = _f2_sqr(((x1[0] + b_[0]) % P, (x1[1] + b_[1]) % P))
+    d = (2 * (t[0] - a[0] - c[0]) % P, 2 * (t[1] - a[1] - c[1]) % P)
+    e = (3 * a[0] % P, 3 * a[1] % P)
+    f = _f2_sqr(e)
+    x3 = ((f[0] - 2 * d[0]) % P, (f[1] - 2 * d[1]) % P)
+    t = _f2_mul(e, ((d[0] - x3[0]) % P, (d[1] - x3[1]) % P))
+    y3 = ((t[0] - 8 * c[0]) % P, (t[1] - 8 * c[1]) % P)
+    t = _f2_mul(y1, z1)
+    z3 = (2 * t[0] % P, 2 * t[1] % P)
+    return (x3, y3, z3)
+
+
+def g2_add(p1, p2):
+    """Sum of two G2 points, with mixed addition if either one is affine"""
+    x1, y1, z1 = p1
+    x2, y2, z2 = p2
+    if z1 == F2_ZERO:
+        return p2
+    if z2 == F2_ZERO:
+        return p1
+    if z1 == F2_ONE and z2 != F2_ONE:
+        x1, y1, z1, x2, y2, z2 = x2, y2, z2, x1, y1, z1
+
+    z1z1 = _f2_sqr(z1)
+    if z2 == F2_ONE:
+        u1, s1 = x1, y1
+        z1z2 = z1
+    else:
+        z2z2 = _f2_sqr(z2)
+        u1 = _f2_mul(x1, z2z2)
+        s1 = _f2_mul(y1, _f2_mul(z2, z2z2))
+        z1z2 = _f2_mul(z1, z2)
+    u2 = _f2_mul(x2, z1z1)
+    s2 = _f2_mul(y2, _f2_mul(z1, z1z1))
+    h = ((u2[0] - u1[0]) % P, (u2[1] - u1[1]) % P)
+    r = (2 * (s2[0] - s1[0]) % P, 2 * (s2[1] - s1[1]) % P)
+    if h == F2_ZERO:
+        if r == F2_ZERO:
+            return g2_double(p1)
+        return G2_INFINITY
+    hh = _f2_sqr(h)
+    i = (4 * hh[0] % P, 4 * hh[1] % P)
+    j = _f2_mul(h, i)
+    v = _f2_mul(u1, i)
+    rr = _f2_sqr(r)
+    x3 = ((rr[0] - j[0] - 2 * v[0]) % P, (rr[1] - j[1] - 2 * v[1]) % P)
+    t = _f2_mul(r, ((v[0] - x3[0]) % P, (v[1] - x3[1]) % P))
+    sj = _f2_mul(s1, j)
+    y3 = ((t[0] - 2 * sj[0]) % P, (t[1] - 2 * sj[1]) % P)
+    t = _f2_mul(z1z2, h)
+    z3 = (2 * t[0] % P, 2 * t[1] % P)
+    return (x3, y3, z3)
+
+
+def g2_batch_normalize(points):
+    """G2 version of batch_normalize()"""
+    prefix = [F2_ONE] * (len(points) + 1)
+    for i, (_, _, z) in enumerate(points):
+        prefix[i + 1] = _f2_mul(prefix[i], z) if z != F2_ZERO and z != F2_ONE else prefix[i]
+    inv_acc = _f2_inv(prefix[-1])
+    o = [None] * len(points)
+    for i in range(len(points) - 1, -1, -1):
+        x, y, z = points[i]
+        if z == F2_ZERO or z == F2_ONE:
+            o[i] = points[i] if z == F2_ONE else G2_INFINITY
+            continue
+        z_inv = _f2_mul(prefix[i], inv_acc)
+        inv_acc = _f2_mul(inv_acc, z)
+        z_inv2 = _f2_sqr(z_inv)
+        o[i] = (_f2_mul(x, z_inv2), _f2_mul(y, _f2_mul(z_inv2, z_inv)), F2_ONE)
+    return o
@@ -0,0 +1,66 @@
+import functools
+
+from py_ecc import optimized_bls12_381 as b
+
+from field import FieldVector, powers
+from imported.fft import bit_reversal_permutation
+
+PRIMITIVE_ROOT = 5
+MODULUS = b.curve_order
+
+
+class Coset(object):
+    """
+    The coset x * w^i of the n-th roots of unity w^i, with what interpolating and checking a
+    multiproof over it needs
+    """
+    def __init__(self, x, n):
+        self.x = x
+        self.n = n
+        # x^n, for the [s^n - x^n] term of the pairing check
+        self.xn = pow(x, n, MODULUS)
+        # 1, 1/x, 1/x^2, ..., to move a polynomial interpolated on the subgroup to the coset
+        self.inverse_powers = powers(pow(x, -1, MODULUS), n)
+
+
+class Domain(object):
+    """
+    Evaluation domain of the `size`-th roots of unity (size is a power of two)
+    """
+    def __init__(self, size):
+        assert size > 0 and size & (size - 1) == 0
+        assert (MODULUS - 1) % size == 0
+        self.size = size
+        self.root_of_unity = pow(PRIMITIVE_ROOT, (MODULUS - 1) // size, MODULUS)
+        # All powers of the root of unity and of its inverse
+        self.roots = powers(self.root_of_unity, size)
+        self.inverse_roots = FieldVector(self.roots[:1] + self.roots[:0:-1])
+        # reverse_bit_order[i] is i with its log2(size) bits reversed
+        self.reverse_bit_order = bit_reversal_permutation(size)
+        self._coset_factors = {}
+
+    def coset_factor(self, sample_index, n_openings):
+        """
+        Shift factor of the coset holding sample `sample_index` of `n_openings` elements, when the
+        domain is laid out in reverse bit order
+        """
+        key = (sample_index, n_openings)
+        if key not in self._coset_factors:
+            self._coset_factors[key] = self.roots[self.reverse_bit_order[n_openings * sample_index]]
+        return self._coset_factors[key]
+
+    def coset(self, sample_index, n_openings):
+        return get_coset(self.coset_factor(sample_index, n_openings), n_openings)
+
+
+_domains = {}
+
+def get_domain(size):
+    if size not in _domains:
+        _domains[size] = Domain(size)
+    return _domains[size]
+
+# Samples of the setup's domain only use a few hundred cosets, but shifts can be arbitrary
+@functools.lru_cache(maxsize=4096)
+def get_coset(x, n):
+    return Coset(x, n)
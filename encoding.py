@@ -0,0 +1,43 @@
+# Compact encodings of field elements and G1 points, as used by samples and blobs and on the wire.
+#
+# Field elements are 32 bytes big-endian. G1 points are 48 byte compressed encodings (the x
+# coordinate with flag bits for infinity and the sign of y, as in the BLS standards).
+
+from py_ecc import optimized_bls12_381 as b
+from py_ecc.bls.point_compression import compress_G1, decompress_G1
+
+MODULUS = b.curve_order
+
+FIELD_ELEMENT_SIZE = 32
+COMPRESSED_G1_SIZE = 48
+
+
+def pack_field_elements(values):
+    """Field elements as one buffer of 32 byte big-endian integers"""
+    return b''.join((x % MODULUS).to_bytes(FIELD_ELEMENT_SIZE, 'big') for x in values)
+
+
+def unpack_field_elements(buf):
+    """Inverse of pack_field_elements(), for any bytes-like `buf`. Raises ValueError on values >= the modulus."""
+    with memoryview(buf) as view:
+        if len(view) % FIELD_ELEMENT_SIZE:
+            raise ValueError("field element buffer of %d bytes" % len(view))
+        values = [int.from_bytes(view[i:i + FIELD_ELEMENT_SIZE], 'big') for i in range(0, len(view), FIELD_ELEMENT_SIZE)]
+    for x in values:
+        if x >= MODULUS:
+            raise ValueError("not a field element: %d" % x)
+    return values
+
+
+def compress_g1(point):
+    return compress_G1(point).to_bytes(COMPRESSED_G1_SIZE, 'big')
+
+
+def decompress_g1(buf):
+    """
+    G1 point (with z = 1) from its compressed encoding. Raises ValueError if it is not a point on
+    the curve.
+    """
+    if len(buf) != COMPRESSED_G1_SIZE:
+        raise ValueError("compressed G1 point of %d bytes" % len(buf))
+    return decompress_G1(int.from_bytes(buf, 'big'))
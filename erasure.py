@@ -0,0 +1,96 @@
+# Reed-Solomon extension of blobs and matrices, and recovery of missing samples.
+#
+# Data is always in evaluation form and in reverse bit order, like the data of a Blob. In that order
+# the first half of an extension is the original data: the n-th roots of unity are the even powers
+# of the 2n-th ones, which sit at positions 0..n-1 once bit-reversed.
+
+from py_ecc import optimized_bls12_381 as b
+
+from domain import PRIMITIVE_ROOT
+from field import FieldVector, batch_inverse, powers
+from imported.fft import ntt
+from imported.kzg_proofs import get_root_of_unity, list_to_reverse_bit_order
+
+MODULUS = b.curve_order
+
+
+def extend_data(data_points):
+    """
+    Reed-Solomon extension of `data_points` to twice their number
+    """
+    n = len(data_points)
+    polynomial = ntt(FieldVector(data_points), MODULUS, get_root_of_unity(n), inv=True, bit_reversed_input=True)
+    evaluations = ntt(polynomial + [0] * n, MODULUS, get_root_of_unity(2 * n))
+    extended = list_to_reverse_bit_order(evaluations)
+    assert extended[:n] == list(data_points)
+    return extended
+
+
+def extend_columns(rows):
+    """
+    Extension of every column of a matrix of data rows to twice the number of rows
+    """
+    columns = [extend_data(column) for column in zip(*rows)]
+    return [list(row) for row in zip(*columns)]
+
+
+def extend_matrix(rows):
+    """
+    2D extension of a matrix of data rows: every column is extended to twice the number of rows,
+    then every row to twice its length
+    """
+    return [extend_data(row) for row in extend_columns(rows)]
+
+
+def coset_zero_polynomial(missing_cosets, n_openings, coset_factors):
+    """
+    Coefficients of the polynomial vanishing on every missing coset: the product of
+    X^n_openings - x^n_openings over the shift factors x of the missing cosets
+    """
+    # Multiply out the product in Y = X^n_openings, then spread the coefficients out
+    z = [1]
+    for j in missing_cosets:
+        c = pow(coset_factors[j], n_openings, MODULUS)
+        z = [((z[i - 1] if i > 0 else 0) - c * (z[i] if i < len(z) else 0)) % MODULUS for i in range(len(z) + 1)]
+    o = [0] * ((len(z) - 1) * n_openings + 1)
+    for i, c in enumerate(z):
+        o[i * n_openings] = c
+    return o
+
+
+def recover_data(samples, n_openings, coset_factors):
+    """
+    Recover all evaluations of an extended blob from the samples that are available.
+
+    `samples` has one entry per sample position: its `n_openings` evaluations, or None if missing.
+    At least half of the evaluations must be available. Returns all evaluations.
+
+    This uses the zero polynomial method: with Z vanishing on the missing positions, E * Z is known
+    everywhere (it is zero where E is missing), so it can be interpolated with an inverse FFT and
+    divided by Z on a coset of the domain, where Z has no zeroes. All of it is O(n log n).
+    """
+    width = len(samples) * n_openings
+    missing = [j for j, sample in enumerate(samples) if sample is None]
+    assert len(missing) * 2 <= len(samples), "need at least half of the samples to recover"
+    if not missing:
+        return [y for sample in samples for y in sample]
+    root_of_unity = get_root_of_unity(width)
+
+    # Z in coefficient and evaluation form
+    zero_polynomial = coset_zero_polynomial(missing, n_openings, coset_factors)
+    zero_evaluations = ntt(FieldVector(zero_polynomial + [0] * (width - len(zero_polynomial))), MODULUS, root_of_unity)
+
+    # E * Z in evaluation form (the data is bit-reversed, the FFT output is not)
+    data = [y for sample in samples for y in (sample if sample is not None else [0] * n_openings)]
+    data_times_zero = FieldVector(list_to_reverse_bit_order(data)).mul(zero_evaluations)
+    data_times_zero_polynomial = ntt(data_times_zero, MODULUS, root_of_unity, inv=True)
+
+    # Divide (E * Z) / Z on the coset shifted by the primitive root
+    shift = powers(PRIMITIVE_ROOT, width)
+    numerator = ntt(data_times_zero_polynomial.mul(shift), MODULUS, root_of_unity)
+    denominator = ntt(FieldVector(zero_polynomial + [0] * (width - len(zero_polynomial))).mul(shift), MODULUS, root_of_unity)
+    shifted_polynomial = ntt(numerator.mul(batch_inverse(denominator)), MODULUS, root_of_unity, inv=True)
+    polynomial = shifted_polynomial.mul(powers(pow(PRIMITIVE_ROOT, -1, MODULUS), width))
+
+    assert all(c == 0 for c in polynomial[width // 2:]), "recovered polynomial has too high a degree"
+    return list_to_reverse_bit_order(ntt(polynomial, MODULUS, root_of_unity))
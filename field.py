@@ -0,0 +1,77 @@
+from py_ecc import optimized_bls12_381 as b
+
+import metrics
+
+MODULUS = b.curve_order
+
+
+class FieldVector(list):
+    """
+    List of scalar field elements (ints in [0, MODULUS)) with elementwise arithmetic.
+
+    The elementwise operations are plain Python loops over ints, for convenience rather than speed:
+    nothing is vectorized. Only inverse() and div() save work, with a single field inversion for
+    the whole vector (batch_inverse()).
+
+    It is a plain list otherwise, so the polynomial and FFT helpers take it as is (ntt() transforms
+    it in place and hands it back). Arithmetic is by method rather than operator, since + and * are
+    already concatenation and repetition on lists. `other` can be a sequence of the same length or
+    a single int.
+    """
+    def _zip(self, other):
+        if isinstance(other, int):
+            return ((x, other) for x in self)
+        assert len(other) == len(self)
+        return zip(self, other)
+
+    def add(self, other):
+        return FieldVector([(x + y) % MODULUS for x, y in self._zip(other)])
+
+    def sub(self, other):
+        return FieldVector([(x - y) % MODULUS for x, y in self._zip(other)])
+
+    def mul(self, other):
+        return FieldVector([x * y % MODULUS for x, y in self._zip(other)])
+
+    def neg(self):
+        return FieldVector([-x % MODULUS for x in self])
+
+    def pow(self, exponent):
+        return FieldVector([pow(x, exponent, MODULUS) for x in self])
+
+    def inverse(self):
+        return batch_inverse(self)
+
+    def div(self, other):
+        if isinstance(other, int):
+            metrics.count('field_inversions')
+            return self.mul(pow(other, -1, MODULUS))
+        return self.mul(batch_inverse(other))
+
+
+def batch_inverse(values):
+    """
+    Invert all (non-zero) values with a single field inversion (Montgomery's trick)
+    """
+    prefix = [1] * (len(values) + 1)
+    for i, x in enumerate(values):
+        assert x % MODULUS != 0, "cannot invert zero"
+        prefix[i + 1] = prefix[i] * x % MODULUS
+    metrics.count('field_inversions')
+    metrics.count('batch_inverted_elements', len(values))
+    inv_acc = pow(prefix[-1], -1, MODULUS)
+    o = [0] * len(values)
+    for i in range(len(values) - 1, -1, -1):
+        o[i] = prefix[i] * inv_acc % MODULUS
+        inv_acc = inv_acc * values[i] % MODULUS
+    return FieldVector(o)
+
+
+def powers(x, n):
+    """
+    The power ladder [1, x, x^2, ..., x^(n-1)]
+    """
+    o = [1] * n
+    for i in range(1, n):
+        o[i] = o[i - 1] * x % MODULUS
+    return FieldVector(o)
@@ -0,0 +1,81 @@
+# All coset multiproofs of a polynomial at once, using the Toeplitz matrix method of Feist and
+# Khovratovich ("FK20")
+
+from py_ecc import optimized_bls12_381 as b
+
+from imported.fft import ntt, fft_g1
+from imported.kzg_proofs import is_power_of_two, get_root_of_unity, list_to_reverse_bit_order, inv
+from field import FieldVector
+from msm import FixedBaseTable, fixed_base_window_size
+from trusted_setup import SETUP
+
+MODULUS = b.curve_order
+
+# (id(setup G1), polynomial length, n_openings) -> (setup G1, per-frequency fixed-base tables)
+# They are kept here rather than in msm.FIXED_BASE_CACHE: one FK20 pass goes through all 2k of them
+# in order, so an LRU smaller than their total size would evict each one before its next use.
+_setup_columns = {}
+
+def get_setup_columns(setup, n, l):
+    """
+    Setup-dependent part of FK20, independent of the polynomial: for each r < l, the 2k point FFT of
+    the vector ([s^r], [s^(l+r)], ..., [s^((k-2)l+r)], 0, ..., 0), where k = n / l. The result is
+    transposed into one list of l points per frequency, and each list gets its fixed-base table.
+    """
+    key = (id(setup[0]), n, l)
+    if key not in _setup_columns:
+        k = n // l
+        root_of_unity = get_root_of_unity(2 * k)
+        rows = []
+        for r in range(l):
+            powers = [setup[0][m * l + r] for m in range(k - 1)]
+            rows.append(fft_g1(powers + [b.Z1] * (k + 1), root_of_unity))
+        c = fixed_base_window_size(l)
+        _setup_columns[key] = (setup[0], [FixedBaseTable([row[j] for row in rows], c) for j in range(2 * k)])
+    return _setup_columns[key][1]
+
+def compute_all_multiproofs(polynomial, n_openings, n_cosets=None, setup=SETUP):
+    """
+    Compute the multiproofs for all cosets of size `n_openings` of the evaluation domain, in the
+    same (reverse bit) order as the samples of a blob. This is equivalent to calling
+    compute_proof_multi() once per sample, in O(n log n) group operations instead of O(n^2).
+
+    The domain has size n_openings * n_cosets, by default the length of the polynomial.
+
+    For a coset with x^l = c, where l = n_openings, the quotient of the polynomial f by X^l - c
+    commits to sum(c^(t-1) * h_t for t in 1..k-1), where k = len(f) / l and
+    h_t = sum(f_i * [s^(i - tl)] for i >= tl).
+    So the proofs are a G1 FFT of (h_1, ..., h_(k-1)). The h_t themselves are a Toeplitz matrix-vector
+    product, computed as l circulant convolutions in Fourier domain against get_setup_columns().
+    """
+    n = len(polynomial)
+    l = n_openings
+    assert is_power_of_two(n) and is_power_of_two(l) and n >= l
+    k = n // l
+    if n_cosets is None:
+        n_cosets = k
+    assert is_power_of_two(n_cosets) and n_cosets >= k
+
+    if k == 1:
+        return [b.Z1] * n_cosets
+
+    # For each r, the FFT of (f_((k-1)l+r), ..., f_(l+r), f_r, 0, ..., 0), scaled by 1/2k so that
+    # the inverse FFT below can be done without the final scaling
+    root_of_unity = get_root_of_unity(2 * k)
+    inv_len = inv(2 * k)
+    coefficient_ffts = []
+    for r in range(l):
+        coefficients = polynomial[r::l][::-1]
+        coefficient_ffts.append(ntt(FieldVector(coefficients + [0] * k), MODULUS, root_of_unity).mul(inv_len))
+
+    # Pointwise products, summed over r
+    columns = get_setup_columns(setup, n, l)
+    h_ext_fft = [columns[j].lincomb([row[j] for row in coefficient_ffts]) for j in range(2 * k)]
+
+    # Inverse FFT; h_t sits at position k - 1 - t of the convolution
+    h_ext = fft_g1(h_ext_fft, inv(root_of_unity))
+    h = [h_ext[k - 1 - t] for t in range(1, k)]
+
+    # Evaluate sum(h_t * Y^(t-1)) at every c = x^l
+    proofs = fft_g1(h + [b.Z1] * (n_cosets - k + 1), get_root_of_unity(n_cosets))
+    return list_to_reverse_bit_order(proofs)
@@ -2,6 +2,9 @@
 
 from py_ecc import optimized_bls12_381 as b
 
+import curve
+import metrics
+
 
 def _simple_ft(vals, modulus, roots_of_unity):
     L = len(roots_of_unity)
@@ -57,3 +60,137 @@ def fft(vals, modulus, root_of_unity, inv=False):
     else:
         # Regular FFT
         return _fft(vals, modulus, rootz[:-1])
+
+
+# Iterative in-place transforms with cached twiddle tables
+
+_twiddles = {}
+_bit_reversal_permutations = {}
+
+
+def get_twiddles(modulus, root_of_unity, n):
+    """
+    Powers root_of_unity^0 ... root_of_unity^(n/2 - 1) of an n-th root of unity (cached)
+    """
+    key = (modulus, root_of_unity, n)
+    if key not in _twiddles:
+        twiddles = [1]
+        for _ in range(n // 2 - 1):
+            twiddles.append(twiddles[-1] * root_of_unity % modulus)
+        _twiddles[key] = twiddles
+    return _twiddles[key]
+
+
+def bit_reversal_permutation(n):
+    """
+    List p such that p[i] is i with its log2(n) bits reversed (cached)
+    """
+    if n not in _bit_reversal_permutations:
+        p = [0] * n
+        for i in range(1, n):
+            p[i] = (p[i >> 1] >> 1) | ((i & 1) * (n >> 1))
+        _bit_reversal_permutations[n] = p
+    return _bit_reversal_permutations[n]
+
+
+def _permute_in_place(vals):
+    p = bit_reversal_permutation(len(vals))
+    for i, j in enumerate(p):
+        if i < j:
+            vals[i], vals[j] = vals[j], vals[i]
+
+
+def ntt(vals, modulus, root_of_unity, inv=False, bit_reversed_input=False):
+    """
+    Iterative radix-2 FFT over field elements, done in place on `vals` (which is also returned).
+    `root_of_unity` must have order len(vals), a power of two.
+
+    The output is in natural order. If `bit_reversed_input` is set, `vals` is taken to already be
+    in reverse bit order, which saves the permutation pass: for example the inverse FFT of
+    list_to_reverse_bit_order(l) is ntt(l, ..., inv=True, bit_reversed_input=True).
+    """
+    n = len(vals)
+    assert n & (n - 1) == 0
+    metrics.count('fft', group='fr', size=n)
+    if inv:
+        root_of_unity = pow(root_of_unity, modulus - 2, modulus)
+    twiddles = get_twiddles(modulus, root_of_unity, n)
+    if not bit_reversed_input:
+        _permute_in_place(vals)
+
+    # Decimation in time butterflies
+    half = 1
+    while half < n:
+        stage_twiddles = twiddles[::n // (2 * half)]
+        for start in range(0, n, 2 * half):
+            for i, w in enumerate(stage_twiddles, start):
+                x = vals[i]
+                y = vals[i + half] * w % modulus
+                vals[i] = (x + y) % modulus
+                vals[i + half] = (x - y) % modulus
+        half *= 2
+
+    if inv:
+        invlen = pow(n, modulus - 2, modulus)
+        for i in range(n):
+            vals[i] = vals[i] * invlen % modulus
+    return vals
+
+
+def fft_g1(points, root_of_unity, inv=False):
+    """
+    FFT over G1 points (a new list is returned). `root_of_unity` must have order len(points), a power
+    of two, in the scalar field.
+
+    The points are brought to affine form before every round of butterflies, so that the scalar
+    multiplications by twiddle factors only use mixed additions.
+    """
+    modulus = b.curve_order
+    n = len(points)
+    assert n & (n - 1) == 0
+    metrics.count('fft', group='g1', size=n)
+    add, _, multiply = metrics.g1_operations()
+    if inv:
+        root_of_unity = pow(root_of_unity, modulus - 2, modulus)
+    twiddles = get_twiddles(modulus, root_of_unity, n)
+    vals = curve.batch_from_py_ecc([points[j] for j in bit_reversal_permutation(n)])
+
+    half = 1
+    while half < n:
+        if half > 1:
+            vals = curve.batch_normalize(vals)
+        stage_twiddles = twiddles[::n // (2 * half)]
+        for start in range(0, n, 2 * half):
+            for i, w in enumerate(stage_twiddles, start):
+                x = vals[i]
+                y = vals[i + half] if w == 1 else multiply(vals[i + half], w)
+                vals[i] = add(x, y)
+                vals[i + half] = add(x, curve.neg(y))
+        half *= 2
+
+    if inv:
+        invlen = pow(n, modulus - 2, modulus)
+        vals = [multiply(x, invlen) for x in curve.batch_normalize(vals)]
+    return [curve.to_py_ecc(x) for x in vals]
+
+
+if __name__ == '__main__':
+    import random, time
+
+    modulus = b.curve_order
+    for logn in range(4, 14):
+        n = 2 ** logn
+        root_of_unity = pow(5, (modulus - 1) // n, modulus)
+        vals = [random.randrange(modulus) for _ in range(n)]
+
+        start = time.time()
+        expected = fft(vals, modulus, root_of_unity, inv=True)
+        recursive_time = time.time() - start
+        ntt(list(vals), modulus, root_of_unity, inv=True)
+        start = time.time()
+        o = ntt(list(vals), modulus, root_of_unity, inv=True)
+        ntt_time = time.time() - start
+        assert o == expected
+
+        print("%5d: recursive %.4fs | iterative %.4fs (%.1fx)" %
+              (n, recursive_time, ntt_time, recursive_time / ntt_time))
@@ -1,12 +1,18 @@
 # taken from research/kzg_data_availability
 
+import collections, mmap, os, secrets
+
 from py_ecc import optimized_bls12_381 as b
 
-from imported.fft import fft
-from imported.multicombs import lincomb
+from imported.fft import ntt, fft_g1, bit_reversal_permutation
+import metrics
+from field import FieldVector
+from domain import PRIMITIVE_ROOT, get_domain, get_coset
+from msm import fixed_base_lincomb, lincomb, setup_fingerprint
+from pairing import pairing_check, prepared_g2
+from trusted_setup import SETUP_DIR, G1_POINT_SIZE, LazyPoints, decode_g1, encode_g1
 
 
-PRIMITIVE_ROOT = 5
 MODULUS = b.curve_order
 
 
@@ -19,6 +25,8 @@ def get_root_of_unity(order):
     Returns a root of unity of order "order"
     """
     assert (MODULUS - 1) % order == 0
+    if is_power_of_two(order):
+        return get_domain(order).root_of_unity
     return pow(PRIMITIVE_ROOT, (MODULUS - 1) // order, MODULUS)
 
 
@@ -28,6 +36,7 @@ def inv(a):
     """
     if a == 0:
         return 0
+    metrics.count('field_inversions')
     lm, hm = 1, 0
     low, high = a % MODULUS, MODULUS
     while low > 1:
@@ -50,14 +59,18 @@ def div_polys(a, b):
     apos = len(a) - 1
     bpos = len(b) - 1
     diff = apos - bpos
+    # The divisor is usually sparse (X^n - c), so only walk its non-zero lower coefficients, and
+    # invert its leading coefficient only once
+    lower_terms = [(i, c) for i, c in enumerate(b[:bpos]) if c % MODULUS != 0]
+    inv_lead = inv(b[bpos])
     while diff >= 0:
-        quot = div(a[apos], b[bpos])
-        o.insert(0, quot)
-        for i in range(bpos, -1, -1):
-            a[diff + i] -= b[i] * quot
+        quot = a[apos] * inv_lead % MODULUS
+        o.append(quot)
+        for i, c in lower_terms:
+            a[diff + i] = (a[diff + i] - c * quot) % MODULUS
         apos -= 1
         diff -= 1
-    return [x % MODULUS for x in o]
+    return FieldVector(o[::-1])
 
 
 def reverse_bit_order(n, order):
@@ -65,22 +78,113 @@ def reverse_bit_order(n, order):
     Reverse the bit order of an integer n
     """
     assert is_power_of_two(order)
-    # Convert n to binary with the same number of bits as "order" - 1, then reverse its bit order
-    return int(('{:0' + str(order.bit_length() - 1) + 'b}').format(n)[::-1], 2)
+    return bit_reversal_permutation(order)[n]
 
 
 def list_to_reverse_bit_order(l):
     """
     Convert a list between normal and reverse bit order. This operation is idempotent.
     """
-    return [l[reverse_bit_order(i, len(l))] for i in range(len(l))]
+    return [l[i] for i in bit_reversal_permutation(len(l))]
 
 
 def commit_to_poly(polynomial, setup):
     """
     Kate commitment to polynomial in coefficient form
     """
-    return lincomb(setup[0][:len(polynomial)], polynomial, b.add, b.Z1)
+    return fixed_base_lincomb(setup[0], polynomial)
+
+
+class LagrangeSetupCache(object):
+    """
+    The setup in Lagrange form, per (setup, domain size n): the points [L_i(s)], where L_i is 1 at
+    w^i and 0 at the other n-th roots of unity (natural order). They are the inverse G1 FFT of
+    [s^0], ..., [s^(n-1)], computed once per n.
+
+    At most `budget` points are kept in memory, dropping the least recently used domain sizes; a
+    larger one is returned without being cached. Note that commit_to_evaluations() also builds a
+    fixed-base table over these points, which counts against the budget of FIXED_BASE_CACHE.
+
+    If `persist_dir` is set (e.g. trusted_setup.SETUP_DIR, next to the setup file), points found
+    there are memory-mapped instead of being recomputed, and unless `read_only` is set, computed
+    points are also written there (if the directory is writable).
+    """
+    def __init__(self, budget, persist_dir=None, read_only=False):
+        self.budget = budget
+        self.persist_dir = persist_dir
+        self.read_only = read_only
+        self.size = 0
+        self.setups = collections.OrderedDict()
+
+    def _path(self, setup, n):
+        return os.path.join(self.persist_dir, 'lagrange_%s_%d.bin' % (setup_fingerprint(setup[0]), n))
+
+    def _load(self, path, n):
+        with open(path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        assert len(buf) == n * G1_POINT_SIZE, "corrupt Lagrange setup file: %s" % path
+        return LazyPoints(buf, 0, n, G1_POINT_SIZE, decode_g1)
+
+    def _save(self, path, points):
+        # A temporary file per process, so that concurrent writers never truncate each other's file
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as f:
+                for point in points:
+                    f.write(encode_g1(point))
+            os.replace(tmp_path, path)
+        except OSError:
+            # Read-only setup directory: keep the points in memory only
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get(self, setup, n):
+        key = (id(setup[0]), n)
+        if key in self.setups:
+            self.setups.move_to_end(key)
+            return self.setups[key][1]
+
+        path = self._path(setup, n) if self.persist_dir is not None else None
+        if path is not None and os.path.exists(path):
+            points = self._load(path, n)
+        else:
+            points = fft_g1(setup[0][:n], get_root_of_unity(n), inv=True)
+            if path is not None and not self.read_only:
+                self._save(path, points)
+        if n > self.budget:
+            return points
+
+        # Keep a reference to the setup so that its id is not reused while cached
+        self.setups[key] = (setup[0], points)
+        self.size += n
+        while self.size > self.budget:
+            (_, evicted), _ = self.setups.popitem(last=False)
+            self.size -= evicted
+        return points
+
+    def clear(self):
+        self.setups.clear()
+        self.size = 0
+
+
+# Enough for the two largest domain sizes the setup allows. It picks up the files precomputed with
+# `trusted_setup.py lagrange`, but never writes into the source tree itself.
+LAGRANGE_SETUP_CACHE = LagrangeSetupCache(budget=16384, persist_dir=SETUP_DIR, read_only=True)
+
+
+def get_lagrange_setup(setup, n):
+    return LAGRANGE_SETUP_CACHE.get(setup, n)
+
+
+def commit_to_evaluations(evaluations, setup, bit_reversed=False):
+    """
+    Kate commitment to the polynomial of degree < n with the given evaluations at the n-th roots of
+    unity (in reverse bit order if `bit_reversed`), n = len(evaluations), without interpolating it
+    """
+    assert is_power_of_two(len(evaluations))
+    if bit_reversed:
+        evaluations = list_to_reverse_bit_order(evaluations)
+    return fixed_base_lincomb(get_lagrange_setup(setup, len(evaluations)), evaluations)
 
 
 def compute_proof_multi(polynomial, x, n, setup):
@@ -89,21 +193,34 @@ def compute_proof_multi(polynomial, x, n, setup):
     an n-th root of unity (this is the proof for one data availability sample, which consists
     of several polynomial evaluations)
     """
-    quotient_polynomial = div_polys(polynomial, [-pow(x, n, MODULUS)] + [0] * (n - 1) + [1])
-    return lincomb(setup[0][:len(quotient_polynomial)], quotient_polynomial, b.add, b.Z1)
+    with metrics.timer('compute_proof_multi.division'):
+        quotient_polynomial = div_polys(polynomial, [-pow(x, n, MODULUS)] + [0] * (n - 1) + [1])
+    with metrics.timer('compute_proof_multi.msm'):
+        return fixed_base_lincomb(setup[0], quotient_polynomial)
 
 
-def check_proof_multi(commitment, proof, x, ys, setup):
+def coset_interpolation(ys, x, bit_reversed=False):
     """
-    Check a proof for a Kate commitment for an evaluation f(x w^i) = y_i
+    Coefficients of the polynomial taking the values ys at the coset x * w^i, where w is a
+    len(ys)-th root of unity. If `bit_reversed`, ys are given in reverse bit order.
     """
     n = len(ys)
     root_of_unity = get_root_of_unity(n)
 
     # Interpolate at a coset. Note because it is a coset, not the subgroup, we have to multiply the
     # polynomial coefficients by x^i
-    interpolation_polynomial = fft(ys, MODULUS, root_of_unity, True)
-    interpolation_polynomial = [div(c, pow(x, i, MODULUS)) for i, c in enumerate(interpolation_polynomial)]
+    interpolation_polynomial = ntt(FieldVector(ys), MODULUS, root_of_unity, inv=True, bit_reversed_input=bit_reversed)
+    return interpolation_polynomial.mul(get_coset(x, n).inverse_powers)
+
+
+def check_proof_multi(commitment, proof, x, ys, setup, bit_reversed=False):
+    """
+    Check a proof for a Kate commitment for an evaluation f(x w^i) = y_i
+    (ys in reverse bit order if `bit_reversed`)
+    """
+    n = len(ys)
+    with metrics.timer('check_proof_multi.interpolation'):
+        interpolation_polynomial = coset_interpolation(ys, x, bit_reversed)
 
     # Verify the pairing equation
     #
@@ -112,10 +229,66 @@ def check_proof_multi(commitment, proof, x, ys, setup):
     # e([commitment - interpolation_polynomial]^(-1), [1]) * e([proof],  [s^n - x^n]) = 1_T
     #
 
-    xn_minus_yn = b.add(setup[1][n], b.multiply(b.neg(b.G2), pow(x, n, MODULUS)))
-    commitment_minus_interpolation = b.add(commitment, b.neg(lincomb(
-        setup[0][:len(interpolation_polynomial)], interpolation_polynomial, b.add, b.Z1)))
-    pairing_check = b.pairing(b.G2, b.neg(commitment_minus_interpolation), False)
-    pairing_check *= b.pairing(xn_minus_yn, proof, False)
-    pairing = b.final_exponentiate(pairing_check)
-    return pairing == b.FQ12.one()
+    # The G2 side of both pairings is fixed for a given coset, so its Miller loop lines are cached
+    coset = get_coset(x, n)
+    g2 = prepared_g2('G2', lambda: b.G2)
+    xn_minus_yn = prepared_g2((id(setup[1]), n, x), lambda: b.add(setup[1][n], b.multiply(b.neg(b.G2), coset.xn)),
+                              setup[1])
+    with metrics.timer('check_proof_multi.msm'):
+        commitment_minus_interpolation = b.add(commitment, b.neg(fixed_base_lincomb(
+            setup[0], interpolation_polynomial)))
+    with metrics.timer('check_proof_multi.pairing'):
+        return pairing_check([(b.neg(commitment_minus_interpolation), g2), (proof, xn_minus_yn)])
+
+
+def check_proof_multi_batch(commitments, proofs, xs, yss, setup, bit_reversed=False):
+    """
+    Check many Kate multiproofs at once, each as in check_proof_multi, with a random linear
+    combination of their pairing equations.
+
+    Moving the x^n term of each check to the left gives
+    e([commitment - interpolation_polynomial(s) + x^n * proof], [1]) = e([proof], [s^n])
+    so with random weights r_i all checks with the same n share both G2 terms:
+    e(sum(r_i * [commitment_i - interpolation_polynomial_i(s) + x_i^n * proof_i]), [1]) =
+        prod_n e(sum(r_i * [proof_i]), [s^n])
+    The interpolation polynomials are combined coefficient-wise, so they cost a single MSM over
+    the setup, and checks with the same commitment share one MSM term.
+    """
+    assert len(commitments) == len(proofs) == len(xs) == len(yss)
+    weights = [secrets.randbits(128) for _ in proofs]
+
+    commitment_weights = {}
+    interpolation_weights = []
+    lhs_points, lhs_scalars = [], []
+    rhs_by_n = {}
+    for commitment, proof, x, ys, r in zip(commitments, proofs, xs, yss, weights):
+        n = len(ys)
+        key = tuple(int(c) for c in b.normalize(commitment)) if not b.is_inf(commitment) else None
+        if key in commitment_weights:
+            commitment_weights[key][1] += r
+        else:
+            commitment_weights[key] = [commitment, r]
+
+        interpolation_polynomial = coset_interpolation(ys, x, bit_reversed)
+        interpolation_weights += [0] * (n - len(interpolation_weights))
+        for i, c in enumerate(interpolation_polynomial):
+            interpolation_weights[i] = (interpolation_weights[i] - r * c) % MODULUS
+
+        lhs_points.append(proof)
+        lhs_scalars.append(r * get_coset(x, n).xn % MODULUS)
+        rhs_points, rhs_scalars = rhs_by_n.setdefault(n, ([], []))
+        rhs_points.append(proof)
+        rhs_scalars.append(r)
+
+    for commitment, r in commitment_weights.values():
+        lhs_points.append(commitment)
+        lhs_scalars.append(r)
+    with metrics.timer('check_proof_multi_batch.msm'):
+        lhs = b.add(lincomb(lhs_points, lhs_scalars), fixed_base_lincomb(setup[0], interpolation_weights))
+        rhs = [(lincomb(rhs_points, rhs_scalars), n) for n, (rhs_points, rhs_scalars) in rhs_by_n.items()]
+
+    pairs = [(b.neg(lhs), prepared_g2('G2', lambda: b.G2))]
+    for point, n in rhs:
+        pairs.append((point, prepared_g2((id(setup[1]), n), lambda: setup[1][n], setup[1])))
+    with metrics.timer('check_proof_multi_batch.pairing'):
+        return pairing_check(pairs)
@@ -0,0 +1,83 @@
+# Incremental updates of a blob's commitment and sample proofs when the data of one sample changes.
+#
+# f has degree < n and is given by its evaluations at the n-th roots of unity, laid out in reverse
+# bit order as in a Blob: sample j (l = n_openings evaluations) is the coset where X^l = c_j, and
+# there are m = n / l samples. Changing the evaluations of sample j0 by d_z at its points z adds
+# g = sum(d_z * L_z) to f, with L_z the Lagrange polynomials, so the commitment moves by
+# sum(d_z * [L_z(s)]): an MSM over the changed Lagrange setup points only.
+#
+# The proof of sample j commits to the quotient of f by X^l - c_j. With
+# P(c, X) = (X^n - 1) / (X^l - c) = sum(c^(m-1-t) * X^(lt)) and e_a = sum(d_z * z^(l-a)) / n,
+# partial fractions give the change of the quotients:
+#   for j != j0 (g vanishes on sample j):  (g - sum(e_a * X^a * P(c_j, X))) / (c_j0 - c_j)
+#   for j0:                                 sum(e_a * X^a * dP/dc(c_j0, X))
+# The commitments to X^a * P(c_j, X) and c_j * X^a * dP/dc(c_j, X) only depend on the setup; for all
+# j at once they are 2l G1 FFTs of size m. So an update is an MSM of at most l + 1 points per proof.
+
+from py_ecc import optimized_bls12_381 as b
+
+import util
+from imported.fft import fft_g1
+from imported.kzg_proofs import get_root_of_unity, list_to_reverse_bit_order, get_lagrange_setup
+from domain import get_domain
+from field import batch_inverse
+from msm import lincomb
+
+MODULUS = b.curve_order
+
+# (id(setup G1), n, l) -> (setup G1, [[s^a P(c_j, s)] for a < l] for j < m,
+#                          [[c_j s^a dP/dc(c_j, s)] for a < l] for j < m)
+_update_bases = {}
+
+def get_update_bases(setup, n, l):
+    """
+    Setup-dependent part of sample_update(), for polynomials of length n and samples of l elements
+    """
+    key = (id(setup[0]), n, l)
+    if key not in _update_bases:
+        m = n // l
+        root_of_unity = get_root_of_unity(m)
+        p_rows, dp_rows = [], []
+        for a in range(l):
+            # P(c, s) s^a = sum(c^t * [s^(a + l(m-1-t))]), c dP/dc(c, s) s^a = sum(t * c^t * ...); the
+            # FFT evaluates them at every m-th root of unity c, and samples come in reverse bit order
+            powers = [setup[0][a + l * (m - 1 - t)] for t in range(m)]
+            p_rows.append(list_to_reverse_bit_order(fft_g1(powers, root_of_unity)))
+            dp_rows.append(list_to_reverse_bit_order(fft_g1([b.multiply(p, t) for t, p in enumerate(powers)], root_of_unity)))
+        _update_bases[key] = (setup[0], [[row[j] for row in p_rows] for j in range(m)],
+                              [[row[j] for row in dp_rows] for j in range(m)])
+    return _update_bases[key][1:]
+
+def sample_update(setup, n, l, sample_index, deltas):
+    """
+    Change of the commitment and of the multiproofs of all samples of a polynomial of length n, when
+    the l evaluations of sample `sample_index` (in the reverse bit order layout of a Blob) change by
+    `deltas`. Returns (commitment delta, [proof delta of sample j for j < n / l]).
+    """
+    m = n // l
+    domain = get_domain(n)
+    positions = [domain.reverse_bit_order[sample_index * l + i] for i in range(l)]
+    changed = [(k, d % MODULUS) for k, d in zip(positions, deltas) if d % MODULUS]
+    lagrange = get_lagrange_setup(setup, n)
+    commitment_delta = lincomb([lagrange[k] for k, _ in changed], [d for _, d in changed])
+    if m == 1 or not changed:
+        return commitment_delta, [b.Z1] * m
+
+    # e_a = sum(d_z * z^(l-a)) / n
+    inv_n = pow(n, -1, MODULUS)
+    e = [sum(d * domain.roots[k * (l - a) % n] for k, d in changed) * inv_n % MODULUS for a in range(l)]
+
+    c = [pow(util.get_coset_factor(j, l), l, MODULUS) for j in range(m)]
+    c0 = c[sample_index]
+    others = [j for j in range(m) if j != sample_index]
+    inverses = dict(zip(others + [sample_index], batch_inverse([c0 - c[j] for j in others] + [c0])))
+    p_bases, dp_bases = get_update_bases(setup, n, l)
+
+    proof_deltas = []
+    for j in range(m):
+        inverse = inverses[j]
+        if j == sample_index:
+            proof_deltas.append(lincomb(dp_bases[j], [x * inverse for x in e]))
+        else:
+            proof_deltas.append(lincomb([commitment_delta] + p_bases[j], [inverse] + [-x * inverse for x in e]))
+    return commitment_delta, proof_deltas
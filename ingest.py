@@ -0,0 +1,88 @@
+# Streaming ingestion of raw payloads into blobs.
+#
+# A payload is cut into fixed-size chunks, one field element each, which are grouped into blobs.
+# Everything works on a memoryview of the payload (usually a memory-mapped file), so only the blobs
+# currently in flight are ever held as field elements.
+
+import collections, mmap, os
+
+from py_ecc import optimized_bls12_381 as b
+
+import params
+from sharding import Blob
+
+MODULUS = b.curve_order
+
+# 31 bytes always fit below the modulus. With 32 bytes per element, chunks must be below the modulus.
+BYTES_PER_FIELD_ELEMENT = 31
+
+
+def iter_field_elements(payload, bytes_per_element=BYTES_PER_FIELD_ELEMENT):
+    """
+    Yield the field elements of a bytes-like payload, one per big-endian chunk of
+    `bytes_per_element` bytes. A short last chunk is padded with zeroes on the right.
+    """
+    assert bytes_per_element in (31, 32)
+    with memoryview(payload) as view:
+        for offset in range(0, len(view), bytes_per_element):
+            with view[offset:offset + bytes_per_element] as chunk:
+                x = int.from_bytes(chunk, 'big') << (8 * (bytes_per_element - len(chunk)))
+            if x >= MODULUS:
+                raise ValueError("chunk at offset %d is not a field element" % offset)
+            yield x
+
+
+def field_elements_to_bytes(elements, length, bytes_per_element=BYTES_PER_FIELD_ELEMENT):
+    """Inverse of iter_field_elements() for a payload of `length` bytes"""
+    return b''.join(x.to_bytes(bytes_per_element, 'big') for x in elements)[:length]
+
+
+def iter_blob_data(payload, bytes_per_element=BYTES_PER_FIELD_ELEMENT):
+    """
+    Yield the data points of consecutive blobs of a payload, the last one padded with zeroes
+    """
+    data = []
+    for x in iter_field_elements(payload, bytes_per_element):
+        data.append(x)
+        if len(data) == params.FIELD_ELEMENTS_PER_BLOB:
+            yield data
+            data = []
+    if data:
+        yield data + [0] * (params.FIELD_ELEMENTS_PER_BLOB - len(data))
+
+
+def _blob_result(data):
+    blob = Blob(data)
+    return blob.commitment, blob.samples
+
+
+def stream_blobs(source, executor=None, max_in_flight=4, bytes_per_element=BYTES_PER_FIELD_ELEMENT):
+    """
+    Turn a payload into blobs, yielding (commitment, samples) for each blob in payload order.
+
+    `source` is a path (which is memory-mapped) or a bytes-like object such as an mmap. With an
+    `executor` (e.g. sharding.make_executor()), blobs are built in parallel with at most
+    `max_in_flight` of them queued at a time; otherwise they are built one by one, as they are
+    consumed.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as payload:
+                yield from stream_blobs(payload, executor, max_in_flight, bytes_per_element)
+        return
+
+    blob_data = iter_blob_data(source, bytes_per_element)
+    if executor is None:
+        for data in blob_data:
+            yield _blob_result(data)
+        return
+
+    in_flight = collections.deque()
+    for data in blob_data:
+        if len(in_flight) >= max_in_flight:
+            yield in_flight.popleft().result()
+        in_flight.append(executor.submit(_blob_result, data))
+    while in_flight:
+        yield in_flight.popleft().result()
@@ -0,0 +1,161 @@
+# Opt-in instrumentation of the hot paths: operation counters and per-stage timers.
+#
+#   with metrics.collect() as m:
+#       blob = Blob(data)
+#   print(m.to_prometheus())
+#
+# While disabled (the default) every hook costs a single flag check. The innermost loops (group
+# additions in MSMs and FFTs) are not hooked at all then: they get their group operations from
+# g1_operations(), which only hands out counting wrappers while enabled.
+#
+# Counts are per process: work done in the workers of a process pool is not seen here.
+
+import collections, contextlib, json, time
+
+import curve
+
+ENABLED = False
+
+# (name, sorted label pairs) -> count
+_counters = collections.Counter()
+# stage -> [number of runs, total seconds]
+_timers = {}
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+def reset():
+    _counters.clear()
+    _timers.clear()
+
+
+def count(name, n=1, **labels):
+    """Add n to counter `name` (with optional labels, e.g. size=128)"""
+    if ENABLED:
+        _counters[(name, tuple(sorted(labels.items())))] += n
+
+
+def _counted(name, f):
+    key = (name, ())
+    def counted(*args):
+        _counters[key] += 1
+        return f(*args)
+    return counted
+
+_G1_OPERATIONS = (curve.add, curve.double, curve.multiply)
+_COUNTED_G1_OPERATIONS = (_counted('g1_add', curve.add), _counted('g1_double', curve.double), _counted('g1_scalar_mul', curve.multiply))
+
+def g1_operations():
+    """(add, double, multiply) for G1 points of the curve module, which count their calls while enabled"""
+    return _COUNTED_G1_OPERATIONS if ENABLED else _G1_OPERATIONS
+
+
+class _Timer(object):
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        entry = _timers.setdefault(self.stage, [0, 0.0])
+        entry[0] += 1
+        entry[1] += time.perf_counter() - self.start
+
+_NULL_TIMER = contextlib.nullcontext()
+
+def timer(stage):
+    """Context manager adding the time spent in the block to `stage`"""
+    return _Timer(stage) if ENABLED else _NULL_TIMER
+
+
+def _format_key(name, labels):
+    if not labels:
+        return name
+    return '%s{%s}' % (name, ','.join('%s="%s"' % (k, v) for k, v in labels))
+
+
+class Snapshot(object):
+    """
+    Counter values and stage timings at some point, or between two points (subtract snapshots)
+    """
+    def __init__(self, counters, timers):
+        self.counters = counters
+        self.timers = timers
+
+    def __sub__(self, other):
+        counters = {key: n - other.counters.get(key, 0) for key, n in self.counters.items()}
+        timers = {}
+        for stage, (runs, seconds) in self.timers.items():
+            other_runs, other_seconds = other.timers.get(stage, (0, 0.0))
+            timers[stage] = (runs - other_runs, seconds - other_seconds)
+        return Snapshot({key: n for key, n in counters.items() if n},
+                        {stage: t for stage, t in timers.items() if t[0]})
+
+    def counter(self, name, **labels):
+        """Value of one counter"""
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def total(self, name):
+        """Sum of a counter over all of its labels"""
+        return sum(n for (key, _), n in self.counters.items() if key == name)
+
+    def seconds(self, stage):
+        return self.timers.get(stage, (0, 0.0))[1]
+
+    def to_dict(self):
+        return {
+            'counters': {_format_key(name, labels): n for (name, labels), n in sorted(self.counters.items())},
+            'timers': {stage: {'count': runs, 'seconds': seconds} for stage, (runs, seconds) in sorted(self.timers.items())},
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_prometheus(self, prefix='kzg_'):
+        """The snapshot in the Prometheus text exposition format"""
+        lines = []
+        names = sorted(set(name for name, _ in self.counters))
+        for name in names:
+            lines.append('# TYPE %s%s_total counter' % (prefix, name))
+            for (key, labels), n in sorted(self.counters.items()):
+                if key == name:
+                    lines.append('%s %d' % (_format_key(prefix + name + '_total', labels), n))
+        if self.timers:
+            lines.append('# TYPE %sstage_seconds summary' % prefix)
+            for stage, (runs, seconds) in sorted(self.timers.items()):
+                lines.append('%sstage_seconds_sum{stage="%s"} %r' % (prefix, stage, seconds))
+                lines.append('%sstage_seconds_count{stage="%s"} %d' % (prefix, stage, runs))
+        return '\n'.join(lines) + '\n'
+
+
+def snapshot():
+    """Everything counted so far"""
+    return Snapshot(dict(_counters), {stage: tuple(t) for stage, t in _timers.items()})
+
+
+@contextlib.contextmanager
+def collect():
+    """
+    Enable instrumentation for the duration of the block. Yields a Snapshot which, once the block
+    exits, holds what was counted inside it.
+    """
+    global ENABLED
+    previous = ENABLED
+    start = snapshot()
+    result = Snapshot({}, {})
+    ENABLED = True
+    try:
+        yield result
+    finally:
+        ENABLED = previous
+        delta = snapshot() - start
+        result.counters, result.timers = delta.counters, delta.timers
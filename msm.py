@@ -0,0 +1,342 @@
+import collections, hashlib, os, random, sys, time
+
+from py_ecc import optimized_bls12_381 as b
+
+import curve
+import metrics
+from trusted_setup import G1_POINT_SIZE, decode_g1, encode_g1
+
+MODULUS = b.curve_order
+SCALAR_BITS = MODULUS.bit_length()
+
+
+def signed_digits(scalar, c, n_windows):
+    """
+    Recode a scalar into `n_windows` base 2^c digits in the range [-2^(c-1), 2^(c-1)).
+
+    Negative digits cost nothing extra (negating a point is free), so we only need half the
+    buckets of the unsigned bucket method.
+    """
+    half = 1 << (c - 1)
+    mask = (1 << c) - 1
+    digits = []
+    carry = 0
+    for _ in range(n_windows):
+        digit = (scalar & mask) + carry
+        scalar >>= c
+        if digit >= half:
+            digit -= 1 << c
+            carry = 1
+        else:
+            carry = 0
+        digits.append(digit)
+    assert carry == 0 and scalar == 0
+    return digits
+
+
+def window_count(bits, c):
+    """
+    Number of signed c-bit digits needed for a `bits`-bit scalar: the top digit has to absorb a
+    carry and still stay below 2^(c-1)
+    """
+    return (bits + 1) // c + 1
+
+
+def pippenger_cost(n, c, bits=SCALAR_BITS):
+    """Estimated group operations of the signed bucket method with window size c"""
+    n_windows = window_count(bits, c)
+    return n_windows * (n + 2 * (1 << (c - 1))) + n_windows * c
+
+
+def naive_cost(n, bits=SCALAR_BITS):
+    """Estimated group operations of one double-and-add per point"""
+    return n * (bits + bits // 2)
+
+
+def window_size(n, bits=SCALAR_BITS):
+    """
+    Pick the window size that minimizes the estimated cost for `n` points, or 0 if the naive
+    method is cheaper (very small inputs)
+    """
+    c = min(range(2, 20), key=lambda c: pippenger_cost(n, c, bits))
+    if naive_cost(n, bits) <= pippenger_cost(n, c, bits):
+        return 0
+    return c
+
+
+def bucket_sum(terms, c, add=b.add, neg=b.neg):
+    """
+    Compute sum(digit * point) over (point, digit) pairs with |digit| <= 2^(c-1), using one bucket
+    per digit magnitude. Returns None for an empty sum.
+    """
+    # Put each point into the bucket of its digit
+    buckets = [None] * ((1 << (c - 1)) + 1)
+    for point, digit in terms:
+        if digit == 0:
+            continue
+        if digit < 0:
+            point, digit = neg(point), -digit
+        buckets[digit] = point if buckets[digit] is None else add(buckets[digit], point)
+
+    # sum(j * buckets[j]) as a running sum from the top bucket down
+    running = None
+    o = None
+    for bucket in buckets[:0:-1]:
+        if bucket is not None:
+            running = bucket if running is None else add(running, bucket)
+        if running is not None:
+            o = running if o is None else add(o, running)
+    return o
+
+
+def pippenger(points, scalars, c, add=b.add, double=b.double, neg=b.neg, zero=b.Z1):
+    """
+    Bucket method multi-scalar multiplication with signed-digit windows of c bits
+
+    The group is given by `add`, `double`, `neg` and `zero`, so that this can run on mock values to
+    count operations.
+    """
+    bits = max(s.bit_length() for s in scalars)
+    n_windows = window_count(bits, c)
+    digits = [signed_digits(s, c, n_windows) for s in scalars]
+
+    o = None
+    for w in range(n_windows - 1, -1, -1):
+        if o is not None:
+            for _ in range(c):
+                o = double(o)
+        window_sum = bucket_sum(((p, d[w]) for p, d in zip(points, digits)), c, add, neg)
+        if window_sum is not None:
+            o = window_sum if o is None else add(o, window_sum)
+
+    return zero if o is None else o
+
+
+def naive_lincomb(points, scalars, add=b.add, multiply=b.multiply, zero=b.Z1):
+    o = zero
+    for point, scalar in zip(points, scalars):
+        o = add(o, multiply(point, scalar))
+    return o
+
+
+def lincomb(points, scalars):
+    """
+    Multi-scalar multiplication: compute points[0] * scalars[0] + points[1] * scalars[1] + ...
+
+    This is the single entry point for all G1 linear combinations. The points are brought to affine
+    form first, so that all additions of them into buckets are mixed additions.
+    """
+    assert len(points) == len(scalars)
+    pairs = [(p, s % MODULUS) for p, s in zip(points, scalars) if s % MODULUS != 0]
+    if not pairs:
+        return b.Z1
+    points = [p for p, _ in pairs]
+    scalars = [s for _, s in pairs]
+
+    metrics.count('msm', kind='variable_base')
+    metrics.count('msm_points', len(points))
+    add, double, multiply = metrics.g1_operations()
+    points = curve.batch_from_py_ecc(points)
+    c = window_size(len(points))
+    if c == 0:
+        return curve.to_py_ecc(naive_lincomb(points, scalars, add, multiply, curve.INFINITY))
+    return curve.to_py_ecc(pippenger(points, scalars, c, add, double, curve.neg, curve.INFINITY))
+
+
+def fixed_base_cost(n, c, bits=SCALAR_BITS):
+    """Estimated group operations of a fixed-base MSM with window size c"""
+    return n * window_count(bits, c) + 2 * (1 << (c - 1))
+
+
+def fixed_base_window_size(n, bits=SCALAR_BITS):
+    return min(range(2, 20), key=lambda c: fixed_base_cost(n, c, bits))
+
+
+class FixedBaseTable(object):
+    """
+    Precomputed window table for a fixed list of bases.
+
+    For every base P and window w the table holds 2^(c*w) * P, so an MSM over these bases becomes a
+    single bucket pass over all (table point, digit) pairs with no doublings in between windows.
+    The table points are affine points of the curve module, so that every bucket addition is mixed.
+    """
+    def __init__(self, bases, c, points=None):
+        self.n = len(bases)
+        self.c = c
+        self.n_windows = window_count(SCALAR_BITS, c)
+        if points is None:
+            metrics.count('fixed_base_tables')
+            _, double, _ = metrics.g1_operations()
+            points = []
+            for base in curve.batch_from_py_ecc(bases):
+                for w in range(self.n_windows):
+                    points.append(base)
+                    for _ in range(c):
+                        base = double(base)
+            points = curve.batch_normalize(points)
+        assert len(points) == self.n * self.n_windows
+        self.points = points
+
+    def __len__(self):
+        return len(self.points)
+
+    def lincomb(self, scalars):
+        assert len(scalars) <= self.n
+        terms = []
+        for i, scalar in enumerate(scalars):
+            scalar %= MODULUS
+            if scalar == 0:
+                continue
+            digits = signed_digits(scalar, self.c, self.n_windows)
+            terms.extend(zip(self.points[i*self.n_windows:(i+1)*self.n_windows], digits))
+        metrics.count('msm', kind='fixed_base')
+        metrics.count('msm_points', len(terms) // self.n_windows)
+        o = bucket_sum(terms, self.c, metrics.g1_operations()[0], curve.neg)
+        return b.Z1 if o is None else curve.to_py_ecc(o)
+
+
+def setup_fingerprint(bases):
+    """Short identifier of a setup, derived from its second power"""
+    return hashlib.sha256(encode_g1(bases[1] if len(bases) > 1 else bases[0])).hexdigest()[:16]
+
+
+class FixedBaseCache(object):
+    """
+    In-memory LRU cache of fixed-base tables, one per (setup, prefix length), holding at most
+    `budget` table points in total.
+
+    If `persist_dir` is set (e.g. trusted_setup.SETUP_DIR, next to the setup file), tables are also
+    written there and loaded back instead of being rebuilt.
+    """
+    def __init__(self, budget, persist_dir=None):
+        self.budget = budget
+        self.persist_dir = persist_dir
+        self.size = 0
+        self.tables = collections.OrderedDict()
+
+    def _path(self, bases, n, c):
+        return os.path.join(self.persist_dir, 'fixed_base_%s_%d_%d.bin' % (setup_fingerprint(bases), n, c))
+
+    def _load(self, path, bases, n, c):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) != n * window_count(SCALAR_BITS, c) * G1_POINT_SIZE:
+            raise ValueError("corrupt fixed-base table file: %s (%d bytes)" % (path, len(data)))
+        points = [curve.from_py_ecc(decode_g1(data, i)) for i in range(0, len(data), G1_POINT_SIZE)]
+        return FixedBaseTable(bases[:n], c, points)
+
+    def _save(self, path, table):
+        # A temporary file per process, so that concurrent writers never truncate each other's file
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as f:
+                for point in table.points:
+                    f.write(encode_g1(curve.to_py_ecc(point)))
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get(self, bases, n):
+        """
+        Table for the first n bases (n rounded up to a power of two), or None if it would not fit in
+        the budget, which leaves the cached tables alone
+        """
+        n = min(1 << (n - 1).bit_length(), len(bases))
+        key = (id(bases), n)
+        if key in self.tables:
+            self.tables.move_to_end(key)
+            return self.tables[key][1]
+
+        c = fixed_base_window_size(n)
+        if n * window_count(SCALAR_BITS, c) > self.budget:
+            return None
+        path = self._path(bases, n, c) if self.persist_dir is not None else None
+        if path is not None and os.path.exists(path):
+            table = self._load(path, bases, n, c)
+        else:
+            table = FixedBaseTable(bases[:n], c)
+            if path is not None:
+                self._save(path, table)
+
+        # Keep a reference to `bases` so that its id is not reused while cached
+        self.tables[key] = (bases, table)
+        self.size += len(table)
+        while self.size > self.budget and self.tables:
+            _, (_, evicted) = self.tables.popitem(last=False)
+            self.size -= len(evicted)
+        return table
+
+    def clear(self):
+        self.tables.clear()
+        self.size = 0
+
+
+# About 90k points covers the tables for a 4096 point prefix
+FIXED_BASE_CACHE = FixedBaseCache(budget=200000)
+
+
+def fixed_base_lincomb(bases, scalars):
+    """
+    Compute bases[0] * scalars[0] + bases[1] * scalars[1] + ... for a fixed list of bases (a setup),
+    using precomputed tables from FIXED_BASE_CACHE (or a plain MSM if the table is too large for it)
+    """
+    if len(scalars) == 0:
+        return b.Z1
+    table = FIXED_BASE_CACHE.get(bases, len(scalars))
+    if table is None:
+        return lincomb(bases[:len(scalars)], scalars)
+    return table.lincomb(scalars)
+
+
+# Benchmarks go here
+def make_mock_group():
+    counter = [0]
+    def adder(x, y):
+        counter[0] += 1
+        return x + y
+    def doubler(x):
+        counter[0] += 1
+        return x + x
+    return adder, doubler, counter
+
+def benchmark_lincomb(numcount):
+    from trusted_setup import SETUP
+    import multicombs
+
+    factors = [random.randrange(MODULUS) for _ in range(numcount)]
+
+    # Operation counts on mock integers
+    numbers = [random.randrange(10**20) for _ in range(numcount)]
+    expected = sum(n * f for n, f in zip(numbers, factors))
+    adder, doubler, counter = make_mock_group()
+    c = window_size(numcount)
+    if c == 0:
+        o = naive_lincomb(numbers, factors, add=adder, multiply=lambda x, f: x * f, zero=0)
+        pippenger_ops = naive_cost(numcount)
+    else:
+        o = pippenger(numbers, factors, c, add=adder, double=doubler, neg=lambda x: -x, zero=0)
+        pippenger_ops = counter[0]
+    assert o == expected
+    adder, counter = multicombs.make_mock_adder()
+    o = multicombs.lincomb(numbers, factors, adder=adder)
+    assert o == expected
+    multisubset_ops = SCALAR_BITS * 2 + counter[0]
+
+    # Wall time on G1 points
+    points = SETUP[0][:numcount]
+    start = time.time()
+    o1 = lincomb(points, factors)
+    pippenger_time = time.time() - start
+    start = time.time()
+    o2 = multicombs.lincomb(curve.batch_from_py_ecc(points), factors, curve.add, curve.INFINITY, curve.batch_normalize)
+    multisubset_time = time.time() - start
+    assert b.eq(o1, curve.to_py_ecc(o2))
+
+    print("%5d points (window %2d): pippenger %7d ops %8.3fs | multisubset2 %7d ops %8.3fs" %
+          (numcount, c, pippenger_ops, pippenger_time, multisubset_ops, multisubset_time))
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [16, 128, 1024, 4096]
+    for numcount in sizes:
+        benchmark_lincomb(numcount)
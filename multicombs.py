@@ -49,7 +49,10 @@ def multisubset(numbers, subsets, adder=lambda x,y: x+y, zero=0):
 
 # Alternative algorithm. Less optimal than the above, but much lower bit twiddling
 # overhead and much simpler.
-def multisubset2(numbers, subsets, adder=lambda x,y: x+y, zero=0):
+#
+# If given, `normalize` maps a list of values to equal ones that are cheaper to add (for curve points,
+# affine ones: see curve.batch_normalize), and is applied to the power set tables.
+def multisubset2(numbers, subsets, adder=lambda x,y: x+y, zero=0, normalize=None):
     # Split up the numbers into partitions
     partition_size = 1 + int(math.log(len(subsets) + 1))
     # Align number count to partition size (for simplicity)
@@ -63,6 +66,11 @@ def multisubset2(numbers, subsets, adder=lambda x,y: x+y, zero=0):
         for dimension, value in enumerate(numbers[i:i+partition_size]):
             new_power_set += [adder(n, value) for n in new_power_set]
         power_sets.append(new_power_set)
+    if normalize is not None and power_sets:
+        # All tables at once, so that they share the work (e.g. a single field inversion)
+        size = len(power_sets[0])
+        flat = normalize([x for power_set in power_sets for x in power_set])
+        power_sets = [flat[i:i + size] for i in range(0, len(flat), size)]
     # Compute subset sums, using elements from power set for each range of values
     # ie. with a single power set lookup you can get the sum of _all_ elements in
     # the range partition_size*k...partition_size*(k+1) that are in that subset
@@ -80,13 +88,13 @@ def multisubset2(numbers, subsets, adder=lambda x,y: x+y, zero=0):
 
 # Reduces a linear combination `numbers[0] * factors[0] + numbers[1] * factors[1] + ...`
 # into a multi-subset problem, and computes the result efficiently
-def lincomb(numbers, factors, adder=lambda x,y: x+y, zero=0):
+def lincomb(numbers, factors, adder=lambda x,y: x+y, zero=0, normalize=None):
     # Maximum bit length of a number; how many subsets we need to make
     maxbitlen = max((len(bin(f))-2 for f in factors), default=0)
     # Compute the subsets: the ith subset contains the numbers whose corresponding factor
     # has a 1 at the ith bit
     subsets = [{i for i in range(len(numbers)) if factors[i] & (1 << j)} for j in range(maxbitlen+1)]
-    subset_sums = multisubset2(numbers, subsets, adder=adder, zero=zero)
+    subset_sums = multisubset2(numbers, subsets, adder=adder, zero=zero, normalize=normalize)
     # For example, suppose a value V has factor 6 (011 in increasing-order binary). Subset 0
     # will not have V, subset 1 will, and subset 2 will. So if we multiply the output of adding
     # subset 0 with twice the output of adding subset 1, with four times the output of adding
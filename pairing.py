@@ -0,0 +1,141 @@
+import collections
+
+from py_ecc import optimized_bls12_381 as b
+from py_ecc.optimized_bls12_381.optimized_pairing import pseudo_binary_encoding
+
+import metrics
+
+# Miller loop steps, most significant first: each step doubles, and then adds Q if its bit is set
+MILLER_LOOP_BITS = pseudo_binary_encoding[62::-1]
+
+
+def _line_coefficients(P1, P2):
+    """
+    The line through P1 and P2 (twisted G2 points), evaluated at a G1 point T = (xt, yt, 1), is
+    (A * xt + B * yt + C) / D. Return (A, B, C, D), which do not depend on T.
+
+    This is py_ecc's linefunc() with T factored out.
+    """
+    zero = P1[0].zero()
+    x1, y1, z1 = P1
+    x2, y2, z2 = P2
+    m_numerator = y2 * z1 - y1 * z2
+    m_denominator = x2 * z1 - x1 * z2
+    if m_denominator == zero:
+        if m_numerator != zero:
+            # Vertical line
+            return z1, zero, -x1, z1
+        # Tangent line
+        m_numerator = 3 * x1 * x1
+        m_denominator = 2 * y1 * z1
+    return m_numerator * z1, -(m_denominator * z1), m_denominator * y1 - m_numerator * x1, m_denominator * z1
+
+
+class PreparedG2(object):
+    """
+    A G2 point with the line coefficients of its Miller loop precomputed.
+
+    The line denominators do not depend on the G1 point at all, so their product is folded into a
+    single precomputed inverse as well.
+    """
+    def __init__(self, Q):
+        if not b.is_on_curve(Q, b.b2):
+            raise ValueError("Invalid input - point Q is not on the correct curve")
+        self.point = Q
+        self.lines = []
+        self.is_inf = b.is_inf(Q)
+        if self.is_inf:
+            return
+        twist_Q = b.twist(Q)
+        R, twist_R = Q, twist_Q
+        denominator = b.FQ12.one()
+        for bit in MILLER_LOOP_BITS:
+            A, B, C, D = _line_coefficients(twist_R, twist_R)
+            self.lines.append((A, B, C))
+            denominator = denominator * denominator * D
+            R = b.double(R)
+            twist_R = b.twist(R)
+            if bit == 1:
+                A, B, C, D = _line_coefficients(twist_R, twist_Q)
+                self.lines.append((A, B, C))
+                denominator = denominator * D
+                R = b.add(R, Q)
+                twist_R = b.twist(R)
+        self.inverse_denominator = b.FQ12.one() / denominator
+
+
+def miller_loop_product(pairs):
+    """
+    Product of the Miller loops of (G1 point, PreparedG2) pairs, sharing one accumulator so that
+    each loop step costs one squaring for all pairs together
+    """
+    evaluations = []
+    o = b.FQ12.one()
+    for P, prepared in pairs:
+        if not b.is_on_curve(P, b.b):
+            raise ValueError("Invalid input - point P is not on the correct curve")
+        if prepared.is_inf or b.is_inf(P):
+            continue
+        x, y = b.normalize(P)
+        evaluations.append((x.n, y.n, prepared.lines))
+        o = o * prepared.inverse_denominator
+    metrics.count('miller_loops', len(evaluations))
+
+    f = b.FQ12.one()
+    step = 0
+    for bit in MILLER_LOOP_BITS:
+        f = f * f
+        for x, y, lines in evaluations:
+            A, B, C = lines[step]
+            f = f * (A * x + B * y + C)
+        step += 1
+        if bit == 1:
+            for x, y, lines in evaluations:
+                A, B, C = lines[step]
+                f = f * (A * x + B * y + C)
+            step += 1
+    return f * o
+
+
+def pairing_product(pairs):
+    """
+    prod(e(P, Q)) over (G1 point P, PreparedG2 Q) pairs, with a single final exponentiation
+    """
+    metrics.count('pairing_products')
+    metrics.count('pairings', len(pairs))
+    return b.final_exponentiate(miller_loop_product(pairs))
+
+
+def pairing_check(pairs):
+    """True iff prod(e(P, Q)) over (G1 point P, PreparedG2 Q) pairs is one"""
+    return pairing_product(pairs) == b.FQ12.one()
+
+
+class PreparedG2Cache(object):
+    """
+    LRU cache of PreparedG2 points under caller-chosen keys (for example the coset of a sample,
+    which fixes the [s^n - x^n] term of its check), holding at most `max_entries`
+
+    A key built from id(obj) must pass `obj` as `owner`: the entry keeps a reference to it, so that
+    its id is not reused while cached.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+
+    def get(self, key, make_point, owner=None):
+        """PreparedG2 for `key`, computing the point with make_point() on a miss"""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key][1]
+        prepared = PreparedG2(make_point())
+        self.entries[key] = (owner, prepared)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return prepared
+
+
+PREPARED_G2_CACHE = PreparedG2Cache(max_entries=1024)
+
+def prepared_g2(key, make_point, owner=None):
+    return PREPARED_G2_CACHE.get(key, make_point, owner)
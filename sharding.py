@@ -1,90 +1,562 @@
-import os, random, time
+import collections, concurrent.futures, contextlib, functools, os, random, struct, threading, time
 
 from py_ecc import optimized_bls12_381 as b
 
-from imported.fft import fft
-from imported.kzg_proofs import is_power_of_two, get_root_of_unity, list_to_reverse_bit_order, commit_to_poly, compute_proof_multi, check_proof_multi
+from imported.fft import ntt
+from imported.kzg_proofs import is_power_of_two, get_root_of_unity, commit_to_poly, commit_to_evaluations, compute_proof_multi, check_proof_multi, check_proof_multi_batch
 
+import metrics
 import util
+from encoding import FIELD_ELEMENT_SIZE, COMPRESSED_G1_SIZE, pack_field_elements, unpack_field_elements, compress_g1, decompress_g1
 import params
+from fk20 import compute_all_multiproofs
+from incremental import sample_update
+from erasure import extend_data, extend_columns, recover_data
 from trusted_setup import SETUP
 
 MODULUS = b.curve_order
 
-# Dimensions of our matrix
+# Default dimensions of our matrix, in samples: each cell of the matrix is a sample
 N_MATRIX_ROWS = 4
-N_MATRIX_COLUMNS = 4
+N_MATRIX_COLUMNS = params.SAMPLES_PER_BLOB
 
-# Each cell of the matrix is a sample
-SAMPLES_PER_BLOB = N_MATRIX_COLUMNS
+# Wire format headers: version, sample index, number of field elements; and version, flags, number
+# of samples, field elements per sample, number of field elements. Blobs of version 1 had no flags
+# and are rejected, as whether they are extended is unknown.
+WIRE_VERSION = 1
+BLOB_WIRE_VERSION = 2
+SAMPLE_HEADER = struct.Struct('>BIH')
+BLOB_HEADER = struct.Struct('>BBHHI')
+BLOB_EXTENDED = 1
+
+# Samples of the largest domain the setup can commit to
+MAX_SAMPLES = len(SETUP[0]) // params.FIELD_ELEMENTS_PER_SAMPLE
 
 class Sample(object):
     """
     Represents a DAS sample (16 field elements)
 
-    A sample has a bunch of field elements and a multiproof
+    A sample has a bunch of field elements and a multiproof. Both are kept encoded: the field
+    elements packed into 32 bytes each and the proof as a 48 byte compressed point. The buffers may
+    be views into a larger one, such as the data of a Blob or a received message. The proof is
+    decompressed once, when first needed.
     """
-    def __init__(self, sample_index, data, polynomial):
-        assert len(data) == params.FIELD_ELEMENTS_PER_SAMPLE
+    __slots__ = ('sample_index', '_data', '_proof', '_multiproof')
+
+    def __init__(self, sample_index, data, polynomial, multiproof=None):
+        """
+        Make a sample, computing its multiproof from `polynomial` unless one is given
+
+        `data` is a list of field elements or their packed encoding, and `multiproof` a G1 point or
+        its compressed encoding.
+        """
         n_openings = params.FIELD_ELEMENTS_PER_SAMPLE
+        if not isinstance(data, (bytes, memoryview)):
+            data = pack_field_elements(data)
+        assert len(data) == n_openings * FIELD_ELEMENT_SIZE
 
         self.sample_index = sample_index
-        self.data_points = data
+        self._data = data
+
+        if multiproof is None:
+            shifting_factor = util.get_coset_factor(sample_index, n_openings)
+            with metrics.timer('sample.proof'):
+                multiproof = compute_proof_multi(polynomial, shifting_factor, n_openings, SETUP)
+        if isinstance(multiproof, (bytes, memoryview)):
+            self._multiproof = None
+        else:
+            self._multiproof = util.normalize(multiproof)
+            multiproof = compress_g1(multiproof)
+        assert len(multiproof) == COMPRESSED_G1_SIZE
+        self._proof = multiproof
+
+    @property
+    def data(self):
+        """The packed field elements, without copying"""
+        return memoryview(self._data)
+
+    @property
+    def proof(self):
+        """The compressed multiproof, without copying"""
+        return memoryview(self._proof)
+
+    @property
+    def data_points(self):
+        return unpack_field_elements(self._data)
+
+    @property
+    def multiproof(self):
+        if self._multiproof is None:
+            self._multiproof = decompress_g1(self._proof)
+        return self._multiproof
+
+    def to_bytes(self):
+        return b''.join([SAMPLE_HEADER.pack(WIRE_VERSION, self.sample_index, len(self._data) // FIELD_ELEMENT_SIZE),
+                         self._data, self._proof])
 
-        shifting_factor = util.get_coset_factor(n_openings, sample_index)
-        self.multiproof = compute_proof_multi(polynomial, shifting_factor, n_openings, SETUP)
+    @classmethod
+    def from_bytes(cls, buf):
+        """
+        Sample from its wire format. It keeps views into `buf` rather than copies. Raises ValueError
+        on a malformed message; the proof itself is only decoded when the sample is verified.
+        """
+        view = memoryview(buf)
+        if len(view) < SAMPLE_HEADER.size:
+            raise ValueError("truncated sample")
+        version, sample_index, n_elements = SAMPLE_HEADER.unpack_from(view)
+        if version != WIRE_VERSION:
+            raise ValueError("unsupported sample version %d" % version)
+        if sample_index >= MAX_SAMPLES:
+            raise ValueError("sample index %d out of range" % sample_index)
+        if n_elements != params.FIELD_ELEMENTS_PER_SAMPLE:
+            raise ValueError("sample of %d field elements" % n_elements)
+        data_end = SAMPLE_HEADER.size + n_elements * FIELD_ELEMENT_SIZE
+        if len(view) != data_end + COMPRESSED_G1_SIZE:
+            raise ValueError("sample message of %d bytes" % len(view))
+        data = view[SAMPLE_HEADER.size:data_end]
+        unpack_field_elements(data)
+        return cls(sample_index, data, None, view[data_end:])
 
-    def verify_multiproof(self, commitment):
-        """Verify multiproof given a commitment to this sample"""
+    def __reduce__(self):
+        return (Sample.from_bytes, (self.to_bytes(),))
+
+    def verify_multiproof(self, commitment, cache=None):
+        """
+        Verify multiproof given a commitment to this sample
+
+        With a `cache` (a VerificationCache), a result already in it is used instead of verifying,
+        and a new result is added to it.
+        """
         n_openings = params.FIELD_ELEMENTS_PER_SAMPLE
 
-        shifting_factor = util.get_coset_factor(n_openings, self.sample_index)
-        ys = list_to_reverse_bit_order(self.data_points)
-        assert check_proof_multi(commitment, self.multiproof, shifting_factor, ys, SETUP)
+        ok = cache.get_sample(self, commitment) if cache is not None else None
+        if ok is None:
+            shifting_factor = util.get_coset_factor(self.sample_index, n_openings)
+            with metrics.timer('sample.verify'):
+                ok = check_proof_multi(commitment, self.multiproof, shifting_factor, self.data_points, SETUP, bit_reversed=True)
+            if cache is not None:
+                cache.put_sample(self, commitment, ok)
+        assert ok
+
+        return True
+
+def verify_samples_batch(samples_with_commitments, cache=None):
+    """
+    Verify a list of (sample, commitment) pairs with a single aggregated pairing check.
+
+    Returns True iff all samples verify. Use find_invalid_samples() to locate the bad samples of a
+    failing batch.
+
+    With a `cache`, only the samples without a cached result are checked, and they are all cached as
+    valid if the check passes.
+    """
+    if cache is not None:
+        unknown = []
+        for sample, commitment in samples_with_commitments:
+            ok = cache.get_sample(sample, commitment)
+            if ok is False:
+                return False
+            if ok is None:
+                unknown.append((sample, commitment))
+        if not verify_samples_batch(unknown):
+            return False
+        for sample, commitment in unknown:
+            cache.put_sample(sample, commitment, True)
+        return True
 
+    if not samples_with_commitments:
         return True
+    n_openings = params.FIELD_ELEMENTS_PER_SAMPLE
+
+    commitments = [commitment for _, commitment in samples_with_commitments]
+    proofs = [sample.multiproof for sample, _ in samples_with_commitments]
+    xs = [util.get_coset_factor(sample.sample_index, n_openings) for sample, _ in samples_with_commitments]
+    yss = [sample.data_points for sample, _ in samples_with_commitments]
+    return check_proof_multi_batch(commitments, proofs, xs, yss, SETUP, bit_reversed=True)
+
+def find_invalid_samples(samples_with_commitments, cache=None):
+    """
+    Bisect a batch of (sample, commitment) pairs and return the indices of the ones that fail
+    verification (caching every result with a `cache`)
+    """
+    if verify_samples_batch(samples_with_commitments, cache):
+        return []
+    if len(samples_with_commitments) == 1:
+        if cache is not None:
+            cache.put_sample(samples_with_commitments[0][0], samples_with_commitments[0][1], False)
+        return [0]
+    mid = len(samples_with_commitments) // 2
+    left = find_invalid_samples(samples_with_commitments[:mid], cache)
+    right = find_invalid_samples(samples_with_commitments[mid:], cache)
+    return left + [mid + i for i in right]
+
+def init_worker():
+    """
+    Process pool initializer: decode the setup points and build the FK20 and MSM tables once per
+    worker, rather than once per task
+    """
+    n = params.FIELD_ELEMENTS_PER_BLOB
+    SETUP[0][:n]
+    compute_all_multiproofs([0] * n, params.FIELD_ELEMENTS_PER_SAMPLE)
+
+def make_executor(workers):
+    """Process pool for building blobs, with the trusted setup loaded in every worker"""
+    return concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+
+@contextlib.contextmanager
+def _executor_for(executor, workers):
+    """Use `executor` if given, else a pool of `workers` processes for the duration of the block"""
+    if executor is not None or not workers:
+        yield executor
+    else:
+        with make_executor(workers) as executor:
+            yield executor
+
+def _interpolate(data_points):
+    """Coefficients of the polynomial of a blob's data, which is in reverse bit order"""
+    with metrics.timer('blob.interpolation'):
+        return ntt(list(data_points), MODULUS, get_root_of_unity(len(data_points)), inv=True, bit_reversed_input=True)
+
+def _sample_multiproof(polynomial, sample_index):
+    n_openings = params.FIELD_ELEMENTS_PER_SAMPLE
+    shifting_factor = util.get_coset_factor(sample_index, n_openings)
+    return compress_g1(compute_proof_multi(polynomial, shifting_factor, n_openings, SETUP))
+
+def _compute_multiproofs(polynomial, n_samples):
+    """Compressed multiproofs of the first n_samples samples of a polynomial, all at once with FK20"""
+    n_openings = params.FIELD_ELEMENTS_PER_SAMPLE
+    proofs = compute_all_multiproofs(polynomial, n_openings, max(n_samples, len(polynomial) // n_openings))
+    return [compress_g1(proof) for proof in proofs[:n_samples]]
+
+def _add_to_point(point, delta):
+    """Compressed point + delta"""
+    if b.is_inf(delta):
+        return bytes(point)
+    return compress_g1(b.add(decompress_g1(point), delta))
 
 class Blob(object):
     """
     Represents a blob (a row of the matrix)
 
-    A blob has a bunch of samples and a commitment that corresponds to the polynomial
+    A blob has a bunch of samples and a commitment that corresponds to the polynomial. It only holds
+    three buffers: the packed data of all samples, their compressed proofs and the compressed
+    commitment. Samples are views into these.
+
+    A lazy blob computes the proof of a sample the first time the sample is asked for, and keeps at
+    most `max_cached_proofs` of them (all if None), dropping the least recently used.
     """
-    def __init__(self, data_points):
-        """Get a blob from a bunch of data bytes"""
-        assert len(data_points) == params.FIELD_ELEMENTS_PER_BLOB
+    __slots__ = ('n_samples', 'extended', 'max_cached_proofs', '_data', '_proofs', '_commitment', '_commitment_point',
+                 '_samples', '_polynomial', '_lock')
+
+    def __init__(self, data_points, extend=False, lazy=False, max_cached_proofs=None):
+        """
+        Get a blob from a bunch of data bytes
 
-        # Polynomial that corresponds to this blob
-        polynomial = fft(list_to_reverse_bit_order(data_points), MODULUS, get_root_of_unity(len(data_points)), inv=True)
+        The data can have any power of two number of field elements from FIELD_ELEMENTS_PER_SAMPLE
+        up to the size of the setup; every FIELD_ELEMENTS_PER_SAMPLE of them make a sample.
 
-        # Split data into samples
-        self.samples = [Sample(i, data_points[i*16:(i+1)*16], polynomial) for i in range(SAMPLES_PER_BLOB)]
+        The sample proofs are all computed at once with FK20. To build several blobs in parallel,
+        see BlobsMatrix.
 
-        # Get commitment to polynomial
-        self.commitment = commit_to_poly(polynomial, SETUP)
+        If `extend` is set, the data is Reed-Solomon extended to twice its size and the blob has
+        a sample for every part of the extension, so that it can be recovered from any half of
+        its samples with recover_blob().
+
+        If `lazy` is set, only the commitment is computed here, straight from the data with the
+        Lagrange form of the setup (see LAGRANGE_SETUP_CACHE); the data is interpolated when the
+        first proof is needed. See
+        warm_up() to compute the proofs ahead of time.
+        """
+        n_openings = params.FIELD_ELEMENTS_PER_SAMPLE
+        assert is_power_of_two(len(data_points)) and n_openings <= len(data_points) <= len(SETUP[0])
+
+        # The proofs need the coefficients anyway, so only a lazy blob commits straight from the data
+        polynomial = None if lazy else _interpolate(data_points)
+        with metrics.timer('blob.commitment'):
+            if lazy:
+                self._commitment_point = commit_to_evaluations(data_points, SETUP, bit_reversed=True)
+            else:
+                self._commitment_point = commit_to_poly(polynomial, SETUP)
+            # In the same affine form as decompress_g1() returns
+            self._commitment_point = util.normalize(self._commitment_point)
+            self._commitment = compress_g1(self._commitment_point)
+
+        if extend:
+            with metrics.timer('blob.extension'):
+                data_points = extend_data(data_points)
+        self.n_samples = len(data_points) // n_openings
+        self.extended = extend
+        self.max_cached_proofs = max_cached_proofs
+        self._data = pack_field_elements(data_points)
+        self._polynomial = self._samples = None
+
+        if lazy:
+            self._proofs = collections.OrderedDict()
+            self._lock = threading.Lock()
+        else:
+            self._lock = None
+            with metrics.timer('blob.proofs'):
+                self._proofs = b''.join(_compute_multiproofs(polynomial, self.n_samples))
+
+    @property
+    def lazy(self):
+        return self._lock is not None
+
+    def _coefficients(self):
+        """Packed coefficients of the polynomial of a lazy blob, interpolated the first time"""
+        with self._lock:
+            if self._polynomial is None:
+                # The data of an extended blob starts with the original data
+                n = len(self._data) // FIELD_ELEMENT_SIZE // (2 if self.extended else 1)
+                data_points = unpack_field_elements(memoryview(self._data)[:n * FIELD_ELEMENT_SIZE])
+                self._polynomial = pack_field_elements(_interpolate(data_points))
+            return self._polynomial
+
+    def proof(self, i):
+        """The compressed multiproof of sample i, computing it if need be"""
+        if not self.lazy:
+            return memoryview(self._proofs)[i*COMPRESSED_G1_SIZE:(i+1)*COMPRESSED_G1_SIZE]
+        with self._lock:
+            proof = self._proofs.get(i)
+            if proof is not None:
+                self._proofs.move_to_end(i)
+                metrics.count('lazy_proofs', result='hit')
+                return proof
+        metrics.count('lazy_proofs', result='miss')
+        polynomial = self._coefficients()
+        with metrics.timer('blob.lazy_proof'):
+            proof = _sample_multiproof(unpack_field_elements(polynomial), i)
+        self._cache_proofs({i: proof}, polynomial)
+        return proof
+
+    def _cache_proofs(self, proofs, polynomial):
+        with self._lock:
+            if polynomial is not self._polynomial:
+                # The blob was updated meanwhile
+                return
+            for i, proof in proofs.items():
+                if self.max_cached_proofs is not None and i not in self._proofs and len(self._proofs) >= self.max_cached_proofs:
+                    if self.max_cached_proofs == 0:
+                        return
+                    self._proofs.popitem(last=False)
+                self._proofs[i] = proof
+
+    def _all_proofs(self):
+        if not self.lazy:
+            return [self._proofs]
+        with self._lock:
+            cached = dict(self._proofs)
+        if len(cached) == self.n_samples:
+            return [cached[i] for i in range(self.n_samples)]
+        proofs = _compute_multiproofs(unpack_field_elements(self._coefficients()), self.n_samples)
+        return [cached.get(i, proofs[i]) for i in range(self.n_samples)]
+
+    def warm_up(self, background=False):
+        """
+        Compute the proofs of a lazy blob that are not cached yet (as many as fit under
+        max_cached_proofs), all at once with FK20. With `background`, this runs in a daemon thread,
+        which is returned.
+        """
+        if background:
+            thread = threading.Thread(target=self.warm_up, daemon=True)
+            thread.start()
+            return thread
+        if not self.lazy:
+            return None
+        with self._lock:
+            missing = [i for i in range(self.n_samples) if i not in self._proofs]
+            room = len(missing) if self.max_cached_proofs is None else self.max_cached_proofs - len(self._proofs)
+        if not missing or room <= 0:
+            return None
+        polynomial = self._coefficients()
+        with metrics.timer('blob.proofs'):
+            proofs = _compute_multiproofs(unpack_field_elements(polynomial), self.n_samples)
+        self._cache_proofs({i: proofs[i] for i in missing[:room]}, polynomial)
+        return None
+
+    def update(self, sample_index, new_data):
+        """
+        Replace the data of sample `sample_index` with `new_data` (field elements or their packed
+        encoding). The commitment and the proofs are updated incrementally (see incremental.py),
+        which costs a small MSM per proof instead of building the blob again. Samples taken from
+        the blob before keep their old data and proofs.
+
+        Extended blobs cannot be updated, as every part of the extension would change.
+        """
+        if self.extended:
+            raise ValueError("cannot update an extended blob")
+        assert 0 <= sample_index < self.n_samples
+        n_openings = params.FIELD_ELEMENTS_PER_SAMPLE
+        if isinstance(new_data, (bytes, memoryview)):
+            new_data = unpack_field_elements(new_data)
+        assert len(new_data) == n_openings
+        sample_size = n_openings * FIELD_ELEMENT_SIZE
+        start = sample_index * sample_size
+        old_data = unpack_field_elements(memoryview(self._data)[start:start + sample_size])
+        deltas = [(x - y) % MODULUS for x, y in zip(new_data, old_data)]
+        n = self.n_samples * n_openings
+
+        with metrics.timer('blob.update'):
+            commitment_delta, proof_deltas = sample_update(SETUP, n, n_openings, sample_index, deltas)
+            data = bytearray(self._data)
+            data[start:start + sample_size] = pack_field_elements(new_data)
+            with self._lock if self.lazy else contextlib.nullcontext():
+                self._data = bytes(data)
+                self._commitment = _add_to_point(self._commitment, commitment_delta)
+                self._commitment_point = self._samples = None
+                if not self.lazy:
+                    self._proofs = b''.join(_add_to_point(self.proof(j), delta) for j, delta in enumerate(proof_deltas))
+                else:
+                    # Interpolated again when needed
+                    self._polynomial = None
+                    for j, proof in self._proofs.items():
+                        self._proofs[j] = _add_to_point(proof, proof_deltas[j])
+
+    @property
+    def commitment(self):
+        """The commitment as a G1 point, decompressed once"""
+        if self._commitment_point is None:
+            self._commitment_point = decompress_g1(self._commitment)
+        return self._commitment_point
+
+    @property
+    def commitment_bytes(self):
+        return memoryview(self._commitment)
+
+    @property
+    def data(self):
+        """The packed data of all samples, without copying"""
+        return memoryview(self._data)
+
+    def sample(self, i):
+        """Sample i, as views into the blob's buffers"""
+        assert 0 <= i < self.n_samples
+        sample_size = len(self._data) // self.n_samples
+        return Sample(i, memoryview(self._data)[i*sample_size:(i+1)*sample_size], None, self.proof(i))
+
+    @property
+    def samples(self):
+        """
+        All samples, as a tuple. It is built once for an eager blob; a lazy blob builds it on every
+        call, so as not to hold on to more proofs than max_cached_proofs.
+        """
+        if self.lazy:
+            return tuple(self.sample(i) for i in range(self.n_samples))
+        if self._samples is None:
+            self._samples = tuple(self.sample(i) for i in range(self.n_samples))
+        return self._samples
+
+    def to_bytes(self):
+        flags = BLOB_EXTENDED if self.extended else 0
+        return b''.join([BLOB_HEADER.pack(BLOB_WIRE_VERSION, flags, self.n_samples, params.FIELD_ELEMENTS_PER_SAMPLE,
+                                          len(self._data) // FIELD_ELEMENT_SIZE),
+                         self._commitment, self._data] + self._all_proofs())
+
+    @classmethod
+    def from_bytes(cls, buf):
+        """Blob from its wire format, keeping views into `buf`. Raises ValueError on a malformed message."""
+        view = memoryview(buf)
+        if len(view) and view[0] != BLOB_WIRE_VERSION:
+            raise ValueError("unsupported blob version %d" % view[0])
+        if len(view) < BLOB_HEADER.size:
+            raise ValueError("truncated blob")
+        version, flags, n_samples, n_openings, n_elements = BLOB_HEADER.unpack_from(view)
+        if n_openings != params.FIELD_ELEMENTS_PER_SAMPLE or n_elements != n_samples * n_openings:
+            raise ValueError("blob of %d samples of %d field elements" % (n_samples, n_openings))
+        data_start = BLOB_HEADER.size + COMPRESSED_G1_SIZE
+        proofs_start = data_start + n_elements * FIELD_ELEMENT_SIZE
+        if len(view) != proofs_start + n_samples * COMPRESSED_G1_SIZE:
+            raise ValueError("blob message of %d bytes" % len(view))
+        blob = cls.__new__(cls)
+        blob.n_samples = n_samples
+        blob.extended = bool(flags & BLOB_EXTENDED)
+        blob.max_cached_proofs = blob._polynomial = blob._lock = blob._commitment_point = blob._samples = None
+        blob._commitment = view[BLOB_HEADER.size:data_start]
+        blob._data = view[data_start:proofs_start]
+        unpack_field_elements(blob._data)
+        blob._proofs = view[proofs_start:]
+        return blob
+
+    def __reduce__(self):
+        return (Blob.from_bytes, (self.to_bytes(),))
+
+def recover_blob(available_samples, commitment=None, n_samples=None):
+    """
+    Recover the data of an extended blob (see Blob) from any half of its `n_samples` samples (by
+    default those of a blob of FIELD_ELEMENTS_PER_BLOB data points).
+
+    Returns the blob's original data points. If a `commitment` is given, the recovered data is
+    checked against it and a ValueError is raised if it does not match.
+    """
+    n_openings = params.FIELD_ELEMENTS_PER_SAMPLE
+    if n_samples is None:
+        n_samples = 2 * params.FIELD_ELEMENTS_PER_BLOB // n_openings
+
+    samples = [None] * n_samples
+    for sample in available_samples:
+        samples[sample.sample_index] = sample.data_points
+    coset_factors = [util.get_coset_factor(j, n_openings) for j in range(n_samples)]
+    data_points = recover_data(samples, n_openings, coset_factors)[:n_samples * n_openings // 2]
+
+    if commitment is not None:
+        if util.normalize(commit_to_evaluations(data_points, SETUP, bit_reversed=True)) != util.normalize(commitment):
+            raise ValueError("recovered blob does not match its commitment")
+    return data_points
 
 class BlobsMatrix(object):
     """
-    Represents a sharding matrix of NxN dimensions and exposes a bunch of handy methods
+    Represents a sharding matrix of data samples and exposes a bunch of handy methods. Every row is
+    a Blob, and every column one sample of each.
     """
-    def __init__(self):
-        """Generate a random sharding matrix"""
-        self.blobs = []
+    def __init__(self, rows=None, executor=None, workers=None, extend=False, n_rows=N_MATRIX_ROWS,
+                 n_columns=N_MATRIX_COLUMNS, lazy=False, max_cached_proofs=None):
+        """
+        Generate a sharding matrix from `rows` of data, or a random one of `n_rows` by `n_columns`
+        samples (n_columns must be a power of two)
+
+        With an `executor` or a number of `workers`, rows are built in parallel, one task per row.
+
+        If `extend` is set, the matrix is Reed-Solomon extended in both dimensions: there are twice
+        as many rows, and every row is an extended Blob.
+
+        If `lazy` is set, the rows are lazy Blobs (see Blob), so that building the matrix only
+        costs the commitments and each proof is computed when its sample is first asked for. A lazy
+        matrix is always built locally: passing an `executor` or `workers` with it raises ValueError.
+        """
+        if lazy and (executor is not None or workers):
+            raise ValueError("a lazy matrix cannot be built in parallel")
+        if rows is None:
+            rows = [[random.randint(0, MODULUS) for i in range(n_columns * params.FIELD_ELEMENTS_PER_SAMPLE)]
+                    for _ in range(n_rows)]
+        if extend:
+            # Extend the columns; the rows get extended by Blob
+            rows = extend_columns(rows)
+
+        make_blob = functools.partial(Blob, extend=extend, lazy=lazy, max_cached_proofs=max_cached_proofs)
+        with _executor_for(executor, workers) as executor:
+            if executor is None:
+                self.blobs = [make_blob(data) for data in rows]
+            else:
+                self.blobs = list(executor.map(make_blob, rows))
 
-        for i in range(N_MATRIX_ROWS):
-            data = [random.randint(0, MODULUS) for i in range(params.FIELD_ELEMENTS_PER_BLOB)]
-            blob = Blob(data)
-            self.blobs.append(blob)
+    def warm_up(self, background=False):
+        """Compute the proofs of all samples of a lazy matrix (see Blob.warm_up)"""
+        if background:
+            thread = threading.Thread(target=self.warm_up, daemon=True)
+            thread.start()
+            return thread
+        for blob in self.blobs:
+            blob.warm_up()
 
     def _get_sample(self, r):
-        n_row = r // SAMPLES_PER_BLOB
-        n_column = r % SAMPLES_PER_BLOB
-        print("get_sample(): got r=%d -> %d row %d column" % (r, n_row, n_column))
+        n_columns = self.blobs[0].n_samples
+        n_row = r // n_columns
+        n_column = r % n_columns
 
         blob = self.blobs[n_row]
-        return blob.samples[n_column], blob.commitment
+        return blob.sample(n_column), blob.commitment
 
     def get_random_sample(self):
-        n_total_samples = SAMPLES_PER_BLOB * N_MATRIX_ROWS
+        n_total_samples = self.blobs[0].n_samples * len(self.blobs)
         r = random.randrange(0, n_total_samples)
         return self._get_sample(r)
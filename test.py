@@ -1,10 +1,26 @@
-import unittest, time, random
+import asyncio, concurrent.futures, os, pickle, struct, tempfile, unittest, time, random
 
 from py_ecc import optimized_bls12_381 as b
 
+import curve
+import domain
+import encoding
+import field
+import fk20
+import metrics
+import msm
+import pairing
 import util
 import params
-from sharding import BlobsMatrix
+from imported.fft import fft, ntt, fft_g1
+from imported.kzg_proofs import LagrangeSetupCache, commit_to_poly, commit_to_evaluations, compute_proof_multi, div_polys, get_root_of_unity, list_to_reverse_bit_order
+import trusted_setup
+import sharding
+from sharding import Blob, BlobsMatrix, Sample, verify_samples_batch, find_invalid_samples, recover_blob
+import erasure
+import ingest
+import verification_cache
+import verifier
 
 MODULUS = b.curve_order
 
@@ -24,6 +40,492 @@ class TestSharding(unittest.TestCase):
         assert sample.verify_multiproof(commitment)
         print("verified multiproof: {:.3f}s".format(get_time_delta()))
 
+        samples_with_commitments = [(s, blob.commitment) for blob in bm.blobs for s in blob.samples]
+        assert verify_samples_batch(samples_with_commitments)
+        print("batch verified {} samples: {:.3f}s".format(len(samples_with_commitments), get_time_delta()))
+
+        bad = samples_with_commitments[5][0]
+        corrupted = Sample(bad.sample_index, [(bad.data_points[0] + 1) % MODULUS] + bad.data_points[1:], None, bad.multiproof)
+        samples_with_commitments[5] = (corrupted, samples_with_commitments[5][1])
+        assert not verify_samples_batch(samples_with_commitments)
+        assert find_invalid_samples(samples_with_commitments) == [5]
+
+    def test_lazy_blob(self):
+        data = [random.randrange(MODULUS) for _ in range(params.FIELD_ELEMENTS_PER_BLOB)]
+        eager = Blob(data)
+        with metrics.collect() as m:
+            lazy = Blob(data, lazy=True, max_cached_proofs=2)
+        assert m.total('pairings') == 0 and 'blob.proofs' not in m.timers
+        assert lazy.commitment == eager.commitment
+
+        # At most two proofs are kept: 3 is still cached when asked for again, 5 was evicted by 1
+        with metrics.collect() as m:
+            for i in [3, 5, 3, 1, 5]:
+                assert bytes(lazy.sample(i).proof) == bytes(eager.sample(i).proof)
+        assert m.counter('lazy_proofs', result='hit') == 1
+        assert m.counter('lazy_proofs', result='miss') == 4
+        assert m.timers['blob.lazy_proof'][0] == 4
+
+        lazy.max_cached_proofs = None
+        lazy.warm_up(background=True).join()
+        with metrics.collect() as m:
+            for i in range(lazy.n_samples):
+                lazy.sample(i)
+            assert lazy.to_bytes() == eager.to_bytes()
+        assert m.counter('lazy_proofs', result='hit') == lazy.n_samples
+        assert m.counter('lazy_proofs', result='miss') == 0 and 'blob.proofs' not in m.timers
+
+    def test_blob_update(self):
+        data = [random.randrange(MODULUS) for _ in range(params.FIELD_ELEMENTS_PER_BLOB)]
+        eager = Blob(data)
+        lazy = Blob(data, lazy=True)
+        lazy.sample(5)
+        old_sample, old_commitment = eager.sample(2), eager.commitment
+
+        new_data = [random.randrange(MODULUS) for _ in range(params.FIELD_ELEMENTS_PER_SAMPLE)]
+        old_data = data[32:48]
+        data[32:48] = new_data
+        expected = Blob(data)
+        eager.update(2, new_data)
+        lazy.update(2, encoding.pack_field_elements(new_data))
+        assert eager.to_bytes() == expected.to_bytes()
+        assert bytes(lazy.proof(5)) == bytes(expected.proof(5))
+        assert lazy.to_bytes() == expected.to_bytes()
+        # Samples taken before the update still refer to the old data
+        assert old_sample.data_points == old_data and old_sample.verify_multiproof(old_commitment)
+
+        with self.assertRaises(ValueError):
+            Blob(data[:16], extend=True).update(0, new_data)
+        assert Blob.from_bytes(Blob(data[:16], extend=True).to_bytes()).extended
+
+    def test_matrix_dimensions(self):
+        bm = BlobsMatrix(n_rows=2, n_columns=2, lazy=True)
+        with self.assertRaises(ValueError):
+            BlobsMatrix(n_rows=2, n_columns=2, lazy=True, workers=2)
+        assert len(bm.blobs) == 2 and all(blob.n_samples == 2 for blob in bm.blobs)
+        sample, commitment = bm.get_random_sample()
+        assert sample.verify_multiproof(commitment)
+        extended = BlobsMatrix(n_rows=2, n_columns=2, extend=True)
+        assert len(extended.blobs) == 4 and all(blob.n_samples == 4 for blob in extended.blobs)
+
+    def test_parallel_construction_matches_serial(self):
+        rows = [[random.randrange(MODULUS) for _ in range(params.FIELD_ELEMENTS_PER_BLOB)] for _ in range(2)]
+        serial = BlobsMatrix(rows)
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            threads = BlobsMatrix(rows, executor=executor)
+        # Blobs come back from worker processes pickled
+        with sharding.make_executor(2) as executor:
+            processes = BlobsMatrix(rows, executor=executor)
+        for parallel in [threads, processes]:
+            for x, y in zip(serial.blobs, parallel.blobs):
+                assert x.to_bytes() == y.to_bytes()
+
+class TestEncoding(unittest.TestCase):
+    def test_wire_format(self):
+        blob = Blob([random.randrange(MODULUS) for _ in range(params.FIELD_ELEMENTS_PER_BLOB)])
+        sample = blob.samples[1]
+        # Decoded points and the samples are kept
+        assert blob.samples is blob.samples and blob.commitment is blob.commitment
+        assert sample.multiproof is sample.multiproof
+        assert bytes(sample.data) == bytes(blob.data[len(sample.data):2 * len(sample.data)])
+
+        received = Sample.from_bytes(sample.to_bytes())
+        assert received.sample_index == 1 and received.data_points == sample.data_points
+        assert received.verify_multiproof(blob.commitment)
+        copy = pickle.loads(pickle.dumps(sample))
+        assert copy.to_bytes() == sample.to_bytes()
+
+        received_blob = Blob.from_bytes(blob.to_bytes())
+        assert received_blob.commitment == blob.commitment
+        assert [s.to_bytes() for s in received_blob.samples] == [s.to_bytes() for s in blob.samples]
+        # A version 1 blob, from before the header had flags
+        old_header = struct.pack('>BHHI', 1, blob.n_samples, params.FIELD_ELEMENTS_PER_SAMPLE, params.FIELD_ELEMENTS_PER_BLOB)
+        with self.assertRaises(ValueError):
+            Blob.from_bytes(old_header + blob.to_bytes()[sharding.BLOB_HEADER.size:])
+
+        message = bytearray(sample.to_bytes())
+        with self.assertRaises(ValueError):
+            Sample.from_bytes(message[:-1])
+        message[0] = 2
+        with self.assertRaises(ValueError):
+            Sample.from_bytes(message)
+        message[0] = 1
+        message[:sharding.SAMPLE_HEADER.size] = sharding.SAMPLE_HEADER.pack(1, sharding.MAX_SAMPLES, params.FIELD_ELEMENTS_PER_SAMPLE)
+        with self.assertRaises(ValueError):
+            Sample.from_bytes(message)
+        message[:sharding.SAMPLE_HEADER.size] = sharding.SAMPLE_HEADER.pack(1, 1, params.FIELD_ELEMENTS_PER_SAMPLE)
+        message[sharding.SAMPLE_HEADER.size:sharding.SAMPLE_HEADER.size + 32] = b'\xff' * 32
+        with self.assertRaises(ValueError):
+            Sample.from_bytes(message)
+
+class TestErasure(unittest.TestCase):
+    def test_extend_matrix(self):
+        rows = [[random.randrange(MODULUS) for _ in range(8)] for _ in range(4)]
+        extended = erasure.extend_matrix(rows)
+        assert len(extended) == 8 and all(len(row) == 16 for row in extended)
+        assert [row[:8] for row in extended[:4]] == rows
+        # Every extended column is an extension of its first half
+        for column in zip(*extended):
+            assert erasure.extend_data(list(column[:4])) == list(column)
+
+    def test_recover_blob(self):
+        data = [random.randrange(MODULUS) for _ in range(params.FIELD_ELEMENTS_PER_BLOB)]
+        blob = Blob(data, extend=True)
+        assert len(blob.samples) == 2 * params.SAMPLES_PER_BLOB
+        assert [y for s in blob.samples[:params.SAMPLES_PER_BLOB] for y in s.data_points] == data
+        assert verify_samples_batch([(s, blob.commitment) for s in blob.samples])
+
+        available = random.sample(blob.samples, len(blob.samples) // 2)
+        assert recover_blob(available, blob.commitment) == data
+        with self.assertRaises(ValueError):
+            recover_blob(available, b.G1)
+
+class TestIngest(unittest.TestCase):
+    def test_iter_blob_data(self):
+        payload = os.urandom(31 * params.FIELD_ELEMENTS_PER_BLOB + 40)
+        blobs = list(ingest.iter_blob_data(payload))
+        assert len(blobs) == 2 and all(len(data) == params.FIELD_ELEMENTS_PER_BLOB for data in blobs)
+        assert ingest.field_elements_to_bytes(blobs[0] + blobs[1], len(payload)) == payload
+        with self.assertRaises(ValueError):
+            list(ingest.iter_field_elements(b'\xff' * 32, bytes_per_element=32))
+
+    def test_stream_blobs(self):
+        payload = os.urandom(31 * params.FIELD_ELEMENTS_PER_BLOB + 40)
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(payload)
+            f.flush()
+            serial = list(ingest.stream_blobs(f.name))
+            with concurrent.futures.ThreadPoolExecutor(2) as executor:
+                parallel = list(ingest.stream_blobs(payload, executor=executor, max_in_flight=1))
+        assert len(serial) == 2
+        assert [commitment for commitment, _ in serial] == [commitment for commitment, _ in parallel]
+        sample = serial[1][1][0]
+        assert sample.verify_multiproof(serial[1][0])
+
+class TestVerifier(unittest.TestCase):
+    def test_async_verifier(self):
+        blob = Blob([random.randrange(MODULUS) for _ in range(params.FIELD_ELEMENTS_PER_BLOB)])
+        messages = [(sample, blob.commitment) for sample in blob.samples] * 3
+        bad = blob.samples[2]
+        corrupted = Sample(bad.sample_index, [(bad.data_points[0] + 1) % MODULUS] + bad.data_points[1:], None, bad.multiproof)
+        messages[5] = (corrupted, blob.commitment)
+
+        async def peer(link):
+            # Stand-in for the network: a peer sending samples over a link
+            for message in messages:
+                await link.put(message)
+            await link.put(None)
+
+        async def node(link, v):
+            pending = []
+            while True:
+                message = await link.get()
+                if message is None:
+                    break
+                pending.append(asyncio.ensure_future(v.verify(*message)))
+            return await asyncio.gather(*pending)
+
+        async def run(executor):
+            link = asyncio.Queue()
+            async with verifier.AsyncVerifier(executor, max_batch=4, batch_window=0.01, max_queue=3, max_in_flight=2) as v:
+                _, results = await asyncio.gather(peer(link), node(link, v))
+                return results, v.stats()
+
+        for make_executor in [lambda: concurrent.futures.ThreadPoolExecutor(2), lambda: sharding.make_executor(2)]:
+            with make_executor() as executor:
+                results, stats = asyncio.run(run(executor))
+            assert results == [i != 5 for i in range(len(messages))]
+            assert stats['valid'] == len(messages) - 1 and stats['invalid'] == 1
+            assert stats['max_queue_depth'] <= 3 and stats['queue_depth'] == 0
+            assert 1 < stats['mean_batch_size'] <= 4
+            assert 0 < stats['latency_p50'] <= stats['latency_p99'] <= stats['latency_max']
+
+    def test_failing_sample_is_isolated(self):
+        blob = Blob([random.randrange(MODULUS) for _ in range(params.FIELD_ELEMENTS_PER_BLOB)])
+        sample = blob.samples[1]
+        # Verifying a sample beyond the domain raises IndexError rather than returning False
+        out_of_range = Sample(10**6, sample.data_points, None, sample.multiproof)
+        results = verifier.verify_batch([(sample, blob.commitment), (out_of_range, blob.commitment)])
+        assert results[0] is True and isinstance(results[1], IndexError)
+
+class TestVerificationCache(unittest.TestCase):
+    def test_eviction_and_ttl(self):
+        now = [0]
+        cache = verification_cache.VerificationCache(max_entries=2, ttl=10, clock=lambda: now[0])
+        cache.put('a', True)
+        cache.put('b', True)
+        assert cache.get('a')
+        cache.put('c', False)
+        assert cache.get('b') is None and cache.get('a') and cache.get('c') is False
+        now[0] = 10
+        assert cache.get('a') is None and len(cache) == 1
+        assert cache.stats['evictions'] == 1 and cache.stats['expirations'] == 1 and cache.stats['hits'] == 3
+
+        fifo = verification_cache.VerificationCache(max_entries=2, eviction=verification_cache.FIFOEviction())
+        fifo.put('a', True)
+        fifo.put('b', True)
+        fifo.get('a')
+        fifo.put('c', True)
+        assert fifo.get('a') is None and fifo.get('b')
+
+    def test_sample_verification(self):
+        blob = Blob([random.randrange(MODULUS) for _ in range(params.FIELD_ELEMENTS_PER_BLOB)])
+        cache = verification_cache.VerificationCache()
+        sample = blob.samples[0]
+        assert sample.verify_multiproof(blob.commitment, cache)
+        with metrics.collect() as m:
+            assert sample.verify_multiproof(blob.commitment, cache)
+        assert m.total('pairings') == 0 and cache.stats['hits'] == 1
+
+        corrupted = Sample(sample.sample_index, [(sample.data_points[0] + 1) % MODULUS] + sample.data_points[1:], None, sample.multiproof)
+        samples_with_commitments = [(s, blob.commitment) for s in blob.samples] + [(corrupted, blob.commitment)]
+        assert find_invalid_samples(samples_with_commitments, cache) == [len(blob.samples)]
+        with self.assertRaises(AssertionError):
+            corrupted.verify_multiproof(blob.commitment, cache)
+        with metrics.collect() as m:
+            assert verify_samples_batch(samples_with_commitments[:-1], cache)
+            assert not verify_samples_batch(samples_with_commitments, cache)
+        assert m.total('pairings') == 0
+
+class TestTrustedSetup(unittest.TestCase):
+    def test_binary_setup_matches_json(self):
+        json_setup = trusted_setup.load_json_setup()
+        binary_setup = trusted_setup.load_binary_setup()
+        assert len(binary_setup[0]) == len(json_setup[0])
+        assert len(binary_setup[1]) == len(json_setup[1])
+        for i in [0, 1, 17, len(json_setup[0]) - 1]:
+            assert binary_setup[0][i] == json_setup[0][i]
+            assert binary_setup[1][i] == json_setup[1][i]
+        assert binary_setup[0][:16] == json_setup[0][:16]
+
+        with tempfile.TemporaryDirectory() as directory:
+            g1_path, g2_path, path = [os.path.join(directory, name) for name in ['G1.json', 'G2.json', 'setup.bin']]
+            for json_path in [g1_path, g2_path]:
+                open(json_path, 'w').close()
+            assert not trusted_setup._binary_setup_is_current(path, g1_path, g2_path)
+            open(path, 'w').close()
+            os.utime(g1_path, (0, os.path.getmtime(path) + 1))
+            assert not trusted_setup._binary_setup_is_current(path, g1_path, g2_path)
+            os.utime(path, (0, os.path.getmtime(path) + 2))
+            assert trusted_setup._binary_setup_is_current(path, g1_path, g2_path)
+
+    def test_generate_setup(self):
+        # The committed setup was made with this (insecure) secret
+        secret = 7851823980
+        setup = trusted_setup.generate_setup(40, secret, 4, chunk_size=16)
+        assert len(setup[0]) == 40 and len(setup[1]) == 4
+        assert setup[0] == trusted_setup.SETUP[0][:40] and setup[1] == trusted_setup.SETUP[1][:4]
+        successive = trusted_setup.generate_setup(5, secret, 2, method='successive', chunk_size=3)
+        assert successive[0] == setup[0][:5] and successive[1] == setup[1][:2]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'setup.bin')
+            trusted_setup.write_binary_setup(setup, path)
+            with trusted_setup.open_binary_setup(path) as loaded:
+                assert loaded[0][:40] == setup[0]
+            assert os.listdir(directory) == ['setup.bin']
+
+    def test_lagrange_setup(self):
+        setup = trusted_setup.SETUP
+        evaluations = [random.randrange(MODULUS) for _ in range(32)]
+        polynomial = ntt(list(evaluations), MODULUS, get_root_of_unity(32), inv=True)
+        expected = util.normalize(commit_to_poly(polynomial, setup))
+        assert util.normalize(commit_to_evaluations(evaluations, setup)) == expected
+        assert util.normalize(commit_to_evaluations(list_to_reverse_bit_order(evaluations), setup, bit_reversed=True)) == expected
+        with tempfile.TemporaryDirectory() as directory:
+            LagrangeSetupCache(64, directory).get(setup, 32)
+            assert len(os.listdir(directory)) == 1
+            cache = LagrangeSetupCache(64, directory)
+            assert cache.get(setup, 32)[:32] == [util.normalize(point) for point in LagrangeSetupCache(32).get(setup, 32)]
+            cache.get(setup, 16)
+            cache.get(setup, 32)
+            cache.get(setup, 64)
+            assert cache.size == 64 and len(cache.setups) == 1
+            # A read-only cache uses the files but writes none
+            assert len(os.listdir(directory)) == 3
+            LagrangeSetupCache(64, directory, read_only=True).get(setup, 8)
+            assert len(os.listdir(directory)) == 3
+
+class TestCurve(unittest.TestCase):
+    def test_arithmetic(self):
+        P1 = b.multiply(b.G1, random.randrange(MODULUS))
+        P2 = b.add(b.multiply(b.G1, 3), b.multiply(b.G1, 5))
+        J1, J2 = curve.from_py_ecc(P1), curve.from_py_ecc(P2)
+        A1, A2, inf = curve.batch_normalize([J1, J2, curve.INFINITY])
+        assert A1[2] == A2[2] == 1 and curve.is_inf(inf)
+        for x, y in [(J1, J2), (A1, J2), (J1, A2), (A1, A2)]:
+            assert b.eq(curve.to_py_ecc(curve.add(x, y)), b.add(P1, P2))
+        assert b.eq(curve.to_py_ecc(curve.add(A1, J1)), b.double(P1))
+        assert curve.is_inf(curve.add(J1, curve.neg(A1)))
+        k = random.randrange(MODULUS)
+        assert curve.eq(curve.multiply(A2, k), curve.from_py_ecc(b.multiply(P2, k)))
+
+    def test_multicombs_normalized(self):
+        from imported import multicombs
+        points = trusted_setup.SETUP[0][:20]
+        factors = [random.randrange(MODULUS) for _ in points]
+        o = multicombs.lincomb(curve.batch_from_py_ecc(points), factors, curve.add, curve.INFINITY, curve.batch_normalize)
+        assert b.eq(curve.to_py_ecc(o), msm.naive_lincomb(points, factors))
+
+class TestMSM(unittest.TestCase):
+    def test_signed_digits(self):
+        for c in [2, 3, 9]:
+            for scalar in [1, 2**128 - 1, 2**(3*c) - 1, MODULUS - 1]:
+                digits = msm.signed_digits(scalar, c, msm.window_count(scalar.bit_length(), c))
+                assert sum(d << (c * i) for i, d in enumerate(digits)) == scalar
+
+    def test_lincomb_matches_naive(self):
+        for n in [1, 3, 40]:
+            points = trusted_setup.SETUP[0][:n]
+            scalars = [random.randrange(MODULUS) for _ in range(n)]
+            scalars[0] = 0
+            expected = msm.naive_lincomb(points, scalars)
+            assert b.eq(msm.lincomb(points, scalars), expected)
+            assert b.eq(msm.pippenger(points, scalars, 4), expected)
+
+    def test_fixed_base_lincomb(self):
+        bases = trusted_setup.SETUP[0]
+        cache = msm.FixedBaseCache(budget=4000)
+        for n in [9, 16]:
+            scalars = [random.randrange(MODULUS) for _ in range(n)]
+            table = cache.get(bases, n)
+            assert table.n == 16
+            assert b.eq(table.lincomb(scalars), msm.lincomb(bases[:n], scalars))
+        assert len(cache.tables) == 1
+        # Too large for the budget: not built, and nothing evicted
+        assert cache.get(bases, 256) is None
+        assert len(cache.tables) == 1
+        cache.get(bases, 128)
+        assert cache.size <= cache.budget and (id(bases), 16) not in cache.tables
+
+        with tempfile.TemporaryDirectory() as directory:
+            scalars = [random.randrange(MODULUS) for _ in range(8)]
+            expected = msm.FixedBaseCache(4000, directory).get(bases, 8).lincomb(scalars)
+            assert b.eq(msm.FixedBaseCache(4000, directory).get(bases, 8).lincomb(scalars), expected)
+            [name] = os.listdir(directory)
+            with open(os.path.join(directory, name), 'r+b') as f:
+                f.truncate(100)
+            with self.assertRaises(ValueError):
+                msm.FixedBaseCache(4000, directory).get(bases, 8)
+
+class TestField(unittest.TestCase):
+    def test_field_vector(self):
+        values = field.FieldVector(random.randrange(1, MODULUS) for _ in range(10))
+        assert values.inverse().mul(values) == [1] * 10
+        assert values.div(values) == [1] * 10
+        assert values.add(values).sub(values) == values
+        assert values.pow(3) == [pow(x, 3, MODULUS) for x in values]
+        assert field.powers(7, 5) == [1, 7, 49, 343, 2401]
+
+    def test_div_polys(self):
+        polynomial = [random.randrange(MODULUS) for _ in range(32)]
+        c = random.randrange(MODULUS)
+        quotient = div_polys(polynomial, [-c] + [0] * 7 + [1])
+        # polynomial = quotient * (X^8 - c) + remainder, with a remainder of degree < 8
+        product = [0] * 8 + list(quotient)
+        for i, q in enumerate(quotient):
+            product[i] -= c * q
+        assert all((p - x) % MODULUS == 0 for p, x in zip(polynomial[8:], product[8:]))
+
+class TestDomain(unittest.TestCase):
+    def test_domain(self):
+        d = domain.get_domain(16)
+        assert domain.get_domain(16) is d
+        assert pow(d.root_of_unity, 16, MODULUS) == 1 and pow(d.root_of_unity, 8, MODULUS) != 1
+        assert all(x * y % MODULUS == 1 for x, y in zip(d.roots, d.inverse_roots))
+        assert list_to_reverse_bit_order(list(range(16))) == d.reverse_bit_order
+        assert d.reverse_bit_order[1] == 8 and d.reverse_bit_order[6] == 6
+        # Sample j of a blob lives on the coset shifted by w^brp(j) of the blob's own domain
+        big = domain.get_domain(len(trusted_setup.SETUP[0]))
+        for j in range(4):
+            assert big.coset_factor(j, 4) == d.coset_factor(j, 4) == d.roots[d.reverse_bit_order[4 * j]]
+        coset = big.coset(3, 4)
+        assert all(x * pow(coset.x, i, MODULUS) % MODULUS == 1 for i, x in enumerate(coset.inverse_powers))
+        assert big.coset(3, 4) is coset and domain.get_coset.cache_info().maxsize is not None
+
+class TestFFT(unittest.TestCase):
+    def test_ntt_matches_recursive_fft(self):
+        for n in [1, 2, 16, 256]:
+            root_of_unity = get_root_of_unity(n)
+            vals = [random.randrange(MODULUS) for _ in range(n)]
+            assert ntt(list(vals), MODULUS, root_of_unity) == fft(vals, MODULUS, root_of_unity)
+            assert ntt(list(vals), MODULUS, root_of_unity, inv=True) == fft(vals, MODULUS, root_of_unity, inv=True)
+            assert ntt(list_to_reverse_bit_order(vals), MODULUS, root_of_unity, inv=True, bit_reversed_input=True) == \
+                fft(vals, MODULUS, root_of_unity, inv=True)
+
+    def test_fft_g1(self):
+        root_of_unity = get_root_of_unity(4)
+        points = trusted_setup.SETUP[0][:4]
+        expected = fft(points, MODULUS, root_of_unity)
+        o = fft_g1(points, root_of_unity)
+        assert all(b.eq(x, y) for x, y in zip(o, expected))
+        assert all(b.eq(x, y) for x, y in zip(fft_g1(o, root_of_unity, inv=True), points))
+
+class TestPairing(unittest.TestCase):
+    def test_pairing_product(self):
+        a = random.randrange(MODULUS)
+        P = b.multiply(b.G1, 1234)
+        Q = b.multiply(b.G2, 5678)
+        prepared = pairing.PreparedG2(Q)
+        assert pairing.pairing_product([(P, prepared)]) == b.pairing(Q, P)
+        # e(a * P, Q) * e(-P, a * Q) = 1
+        assert pairing.pairing_check([(b.multiply(P, a), prepared), (b.neg(P), pairing.PreparedG2(b.multiply(Q, a)))])
+        assert not pairing.pairing_check([(b.multiply(P, a), prepared), (P, pairing.PreparedG2(b.multiply(Q, a)))])
+
+    def test_prepared_g2_cache(self):
+        cache = pairing.PreparedG2Cache(max_entries=1)
+        setup_g2 = [b.G2, b.multiply(b.G2, 3)]
+        prepared = cache.get((id(setup_g2), 1), lambda: setup_g2[1], setup_g2)
+        assert cache.get((id(setup_g2), 1), None) is prepared
+        # The entry keeps the setup alive, so that its id cannot be reused for another one
+        assert any(owner is setup_g2 for owner, _ in cache.entries.values())
+        cache.get('G2', lambda: b.G2)
+        assert len(cache.entries) == 1
+
+class TestFK20(unittest.TestCase):
+    def test_all_multiproofs_match_single_proofs(self):
+        n_openings = 4
+        polynomial = [random.randrange(MODULUS) for _ in range(16)]
+        proofs = fk20.compute_all_multiproofs(polynomial, n_openings, n_cosets=8)
+        assert len(proofs) == 8
+        for j, proof in enumerate(proofs):
+            x = util.get_coset_factor(j, n_openings)
+            assert b.eq(proof, compute_proof_multi(polynomial, x, n_openings, trusted_setup.SETUP))
+
+    def test_setup_tables_are_reused(self):
+        polynomial = [random.randrange(MODULUS) for _ in range(64)]
+        fk20.compute_all_multiproofs(polynomial, 4)
+        cached = list(msm.FIXED_BASE_CACHE.tables)
+        with metrics.collect() as m:
+            fk20.compute_all_multiproofs(polynomial, 4)
+        assert m.total('fixed_base_tables') == 0
+        # The FK20 tables stay out of the shared cache
+        assert list(msm.FIXED_BASE_CACHE.tables) == cached
+
+class TestMetrics(unittest.TestCase):
+    def test_collect(self):
+        data = [random.randrange(MODULUS) for _ in range(params.FIELD_ELEMENTS_PER_BLOB)]
+        # Nothing is recorded while disabled
+        before = metrics.snapshot()
+        Blob(data)
+        delta = metrics.snapshot() - before
+        assert not delta.counters and not delta.timers
+
+        with metrics.collect() as m:
+            blob = Blob(data)
+            assert blob.samples[1].verify_multiproof(blob.commitment)
+        assert not metrics.ENABLED
+        assert m.counter('fft', group='fr', size=params.FIELD_ELEMENTS_PER_BLOB) == 1
+        assert m.counter('pairings') == 2 and m.counter('pairing_products') == 1
+        assert m.counter('g1_add') > 0 and m.total('msm') >= 2 and m.counter('field_inversions') > 0
+        for stage in ['blob.proofs', 'blob.commitment', 'check_proof_multi.msm', 'check_proof_multi.pairing']:
+            assert m.timers[stage][0] == 1 and m.seconds(stage) > 0
+
+        exported = m.to_prometheus()
+        assert '# TYPE kzg_g1_add_total counter' in exported
+        assert 'kzg_fft_total{group="fr",size="%d"} 1' % params.FIELD_ELEMENTS_PER_BLOB in exported
+        assert 'kzg_stage_seconds_count{stage="check_proof_multi.pairing"} 1' in exported
+        assert m.to_dict()['counters']['pairings'] == 2
+
 if __name__ == '__main__':
     unittest.main()
 
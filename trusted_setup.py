@@ -1,44 +1,354 @@
-import json
+import argparse, concurrent.futures, contextlib, json, mmap, os, struct
 
 from py_ecc import optimized_bls12_381 as b
 
+import curve
+
 MODULUS = b.curve_order
 
-with open('trusted_setup_G1.json', 'r') as f:
-    trusted_setup_G1 = json.load(f)
+SETUP_DIR = os.path.dirname(os.path.abspath(__file__))
+SETUP_G1_JSON = os.path.join(SETUP_DIR, 'trusted_setup_G1.json')
+SETUP_G2_JSON = os.path.join(SETUP_DIR, 'trusted_setup_G2.json')
+SETUP_BINARY = os.path.join(SETUP_DIR, 'trusted_setup.bin')
 
-with open('trusted_setup_G2.json', 'r') as f:
-    trusted_setup_G2 = json.load(f)
+# Binary setup format: a fixed header followed by all G1 points and then all G2 points. Every
+# coordinate is a 48-byte big-endian integer, so point i lives at a fixed offset and can be decoded
+# on its own straight out of a memory map. The point at infinity is encoded as all zeroes.
+BINARY_MAGIC = b'KZGS'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('>4sBxxxII')
+COORDINATE_SIZE = 48
+G1_POINT_SIZE = 2 * COORDINATE_SIZE
+G2_POINT_SIZE = 4 * COORDINATE_SIZE
 
-SETUP = []
 
-setup_G1 = []
-for point in trusted_setup_G1["setup_G1"][:-1]:
-    setup_G1.append((b.FQ(int(point[0])), b.FQ(int(point[1])), b.FQ.one()))
+def _coordinates(buf, offset, count):
+    return [int.from_bytes(buf[offset + i*COORDINATE_SIZE:offset + (i+1)*COORDINATE_SIZE], 'big')
+            for i in range(count)]
 
-SETUP.append(setup_G1)
 
-setup_G2 = []
-for point in trusted_setup_G2['setup_G2'][:-1]:
-    setup_G2.append((b.FQ2((int(point[0][0]), int(point[0][1]))), b.FQ2((int(point[1][0]), int(point[1][1]))), b.FQ2.one()))
+def decode_g1(buf, offset=0):
+    """
+    Decode a G1 point stored as big-endian x || y
+    """
+    x, y = _coordinates(buf, offset, 2)
+    if x == 0 and y == 0:
+        return b.Z1
+    return (b.FQ(x), b.FQ(y), b.FQ.one())
 
-SETUP.append(setup_G2)
 
-if __name__ == '__main__':
-    def serialize_g1(point):
-        return int(point)
+def decode_g2(buf, offset=0):
+    """
+    Decode a G2 point stored as big-endian x.c0 || x.c1 || y.c0 || y.c1
+    """
+    x0, x1, y0, y1 = _coordinates(buf, offset, 4)
+    if x0 == x1 == y0 == y1 == 0:
+        return b.Z2
+    return (b.FQ2((x0, x1)), b.FQ2((y0, y1)), b.FQ2.one())
+
+
+def encode_g1(point):
+    if b.is_inf(point):
+        return bytes(G1_POINT_SIZE)
+    return b''.join(int(c).to_bytes(COORDINATE_SIZE, 'big') for c in b.normalize(point))
+
+
+def encode_g2(point):
+    if b.is_inf(point):
+        return bytes(G2_POINT_SIZE)
+    return b''.join(int(c).to_bytes(COORDINATE_SIZE, 'big') for fq2 in b.normalize(point) for c in fq2.coeffs)
+
+
+class LazyPoints(object):
+    """
+    Read-only sequence of curve points backed by a buffer (usually a memory map of the setup file).
+
+    Points are decoded the first time they are accessed and kept afterwards, so the cost of using a
+    setup grows with the number of points actually touched. Slicing returns a plain list.
+    """
+    def __init__(self, buf, offset, count, point_size, decoder):
+        self._buf = buf
+        self._offset = offset
+        self._count = count
+        self._point_size = point_size
+        self._decoder = decoder
+        self._points = [None] * count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("setup point index out of range")
+        point = self._points[i]
+        if point is None:
+            point = self._decoder(self._buf, self._offset + i * self._point_size)
+            self._points[i] = point
+        return point
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+
+def _binary_setup(buf, path):
+    magic, version, n_g1, n_g2 = BINARY_HEADER.unpack_from(buf, 0)
+    assert magic == BINARY_MAGIC, "not a binary trusted setup: %s" % path
+    assert version == BINARY_VERSION, "unsupported trusted setup version %d" % version
+    assert len(buf) == BINARY_HEADER.size + n_g1 * G1_POINT_SIZE + n_g2 * G2_POINT_SIZE
+
+    g1_offset = BINARY_HEADER.size
+    g2_offset = g1_offset + n_g1 * G1_POINT_SIZE
+    return [LazyPoints(buf, g1_offset, n_g1, G1_POINT_SIZE, decode_g1),
+            LazyPoints(buf, g2_offset, n_g2, G2_POINT_SIZE, decode_g2)]
+
+
+def load_binary_setup(path=SETUP_BINARY):
+    """
+    Memory-map a binary trusted setup and return it as [G1 powers, G2 powers]
+
+    The mapping is read-only and shared, so several processes loading the same file share its pages.
+    It stays open as long as the setup is in use; see open_binary_setup() to close it.
+    """
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return _binary_setup(buf, path)
+
+
+@contextlib.contextmanager
+def open_binary_setup(path=SETUP_BINARY):
+    """
+    load_binary_setup() for the duration of a with block: the memory map is closed on exit, after
+    which points that were not decoded yet can no longer be accessed
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        yield _binary_setup(buf, path)
+
+
+def load_json_setup(g1_path=SETUP_G1_JSON, g2_path=SETUP_G2_JSON):
+    """
+    Parse the JSON trusted setup files and return [G1 powers, G2 powers]
+
+    The last power in each file is dropped.
+    """
+    with open(g1_path, 'r') as f:
+        trusted_setup_G1 = json.load(f)
+
+    with open(g2_path, 'r') as f:
+        trusted_setup_G2 = json.load(f)
+
+    setup_G1 = []
+    for point in trusted_setup_G1["setup_G1"][:-1]:
+        setup_G1.append((b.FQ(int(point[0])), b.FQ(int(point[1])), b.FQ.one()))
+
+    setup_G2 = []
+    for point in trusted_setup_G2['setup_G2'][:-1]:
+        setup_G2.append((b.FQ2((int(point[0][0]), int(point[0][1]))), b.FQ2((int(point[1][0]), int(point[1][1]))), b.FQ2.one()))
+
+    return [setup_G1, setup_G2]
 
-    def serialize_g2(point):
-        return int(point.coeffs[0]), int(point.coeffs[1])
 
-    s = 7851823980 # INSECURE s
+def write_binary_setup(setup, path=SETUP_BINARY):
+    """
+    Write [G1 powers, G2 powers] in the binary setup format. The file is written next to `path` and
+    then moved into place, so that a concurrent reader never sees it half written.
+    """
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(setup[0]), len(setup[1])))
+            for point in setup[0]:
+                f.write(encode_g1(point))
+            for point in setup[1]:
+                f.write(encode_g2(point))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
-    setup_G1 = [b.multiply(b.G1, pow(s, i, MODULUS)) for i in range(8192 + 1)]
-    setup_G1 = [b.normalize(pt) for pt in setup_G1]
-    with open('trusted_setup_G1.json', 'w') as f:
-        json.dump({"setup_G1" : setup_G1}, f, default=serialize_g1)
 
-    setup_G2 = [b.multiply(b.G2, pow(s, i, MODULUS)) for i in range(8192 + 1)]
-    setup_G2 = [b.normalize(pt) for pt in setup_G2]
-    with open('trusted_setup_G2.json', 'w') as f:
-        json.dump({"setup_G2" : setup_G2}, f, default=serialize_g2)
+def convert_json_to_binary(g1_path=SETUP_G1_JSON, g2_path=SETUP_G2_JSON, path=SETUP_BINARY):
+    write_binary_setup(load_json_setup(g1_path, g2_path), path)
+
+
+def write_json_setup(setup, g1_path=SETUP_G1_JSON, g2_path=SETUP_G2_JSON):
+    """
+    Write [G1 powers, G2 powers] in the JSON setup format. Note load_json_setup() drops the last
+    power of each file.
+    """
+    with open(g1_path, 'w') as f:
+        json.dump({"setup_G1": [[int(c) for c in b.normalize(point)] for point in setup[0]]}, f)
+    with open(g2_path, 'w') as f:
+        json.dump({"setup_G2": [[list(c.coeffs) for c in b.normalize(point)] for point in setup[1]]}, f)
+
+
+# Setup generation. Every power G * s^i comes from a fixed-base comb: a table of d * 2^(c*w) * G for
+# every c-bit window w and digit d, so it costs one mixed addition per window and no doublings. The
+# powers are independent, so they are generated in chunks, possibly over a process pool.
+
+GENERATION_WINDOW = 8
+
+# group -> (generator, conversion from py_ecc, add, double, batch_normalize, conversion to py_ecc, zero)
+_GROUPS = {
+    'G1': (b.G1, curve.from_py_ecc, curve.add, curve.double, curve.batch_normalize, curve.to_py_ecc, curve.INFINITY),
+    'G2': (b.G2, curve.g2_from_py_ecc, curve.g2_add, curve.g2_double, curve.g2_batch_normalize, curve.g2_to_py_ecc, curve.G2_INFINITY),
+}
+
+_comb_tables = {}
+
+def _comb_table(group, c):
+    if (group, c) not in _comb_tables:
+        generator, from_py_ecc, add, double, batch_normalize, _, _ = _GROUPS[group]
+        table = []
+        base = from_py_ecc(generator)
+        for w in range((MODULUS.bit_length() + c - 1) // c):
+            base = batch_normalize([base])[0]
+            window = [base]
+            for d in range(2, 1 << c):
+                window.append(add(window[-1], base))
+            table.append(window)
+            base = add(window[-1], base)
+        flat = batch_normalize([point for window in table for point in window])
+        size = (1 << c) - 1
+        _comb_tables[(group, c)] = [flat[i:i + size] for i in range(0, len(flat), size)]
+    return _comb_tables[(group, c)]
+
+
+def _comb_multiply(table, scalar, c, add, zero):
+    o = zero
+    mask = (1 << c) - 1
+    for w, window in enumerate(table):
+        digit = (scalar >> (c * w)) & mask
+        if digit:
+            o = add(o, window[digit - 1])
+    return o
+
+
+def _ladder(point, scalar, add, double, zero):
+    o = zero
+    for bit in bin(scalar)[2:]:
+        o = double(o)
+        if bit == '1':
+            o = add(o, point)
+    return o
+
+
+def generate_powers(group, secret, start, count, method='fixed-base', c=GENERATION_WINDOW):
+    """
+    Affine points (of the curve module) G * s^i for i in [start, start + count)
+
+    With method 'successive', only the first one comes from the comb and each next one is the
+    previous one times s, which is faster for small (insecure test) secrets.
+    """
+    _, _, add, double, batch_normalize, _, zero = _GROUPS[group]
+    table = _comb_table(group, c)
+    secret %= MODULUS
+    power = pow(secret, start, MODULUS)
+    if method == 'successive':
+        points = [_comb_multiply(table, power, c, add, zero)]
+        for _ in range(count - 1):
+            points.append(_ladder(points[-1], secret, add, double, zero))
+    else:
+        assert method == 'fixed-base', "unknown method %s" % method
+        points = []
+        for _ in range(count):
+            points.append(_comb_multiply(table, power, c, add, zero))
+            power = power * secret % MODULUS
+    return batch_normalize(points)
+
+
+def generate_setup(size, secret, n_g2=None, method='fixed-base', workers=None, chunk_size=512):
+    """
+    Generate an (insecure: the secret is known) setup [G1 powers, G2 powers] of `size` G1 powers and
+    `n_g2` G2 powers (`size` by default), using a pool of `workers` processes if given
+    """
+    if n_g2 is None:
+        n_g2 = size
+    tasks = [(group, start, min(chunk_size, n - start))
+             for group, n in [('G1', size), ('G2', n_g2)] for start in range(0, n, chunk_size)]
+    args = ([group for group, _, _ in tasks], [secret] * len(tasks), [start for _, start, _ in tasks],
+            [count for _, _, count in tasks], [method] * len(tasks))
+    if workers and workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            chunks = list(executor.map(generate_powers, *args))
+    else:
+        chunks = list(map(generate_powers, *args))
+
+    setup = [[], []]
+    for (group, _, _), chunk in zip(tasks, chunks):
+        to_py_ecc = _GROUPS[group][5]
+        setup[0 if group == 'G1' else 1].extend(to_py_ecc(point) for point in chunk)
+    return setup
+
+
+def _binary_setup_is_current(path=SETUP_BINARY, g1_path=SETUP_G1_JSON, g2_path=SETUP_G2_JSON):
+    """Whether the binary setup exists and is not older than the JSON files it is made from"""
+    if not os.path.exists(path):
+        return False
+    try:
+        json_mtime = max(os.path.getmtime(g1_path), os.path.getmtime(g2_path))
+    except OSError:
+        # No JSON files to rebuild it from
+        return True
+    return os.path.getmtime(path) >= json_mtime
+
+
+def load_setup():
+    """
+    The default setup: the binary file, which is generated from the JSON files on first use (it is
+    not checked in) and again whenever they are newer. Falls back to the JSON files if the directory
+    is read-only.
+    """
+    if not _binary_setup_is_current():
+        try:
+            convert_json_to_binary()
+        except OSError:
+            return load_json_setup()
+    return load_binary_setup(SETUP_BINARY)
+
+
+SETUP = load_setup()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate or convert trusted setups")
+    commands = parser.add_subparsers(dest='command')
+    convert = commands.add_parser('convert', help="convert the JSON setup to the binary format")
+    convert.add_argument('paths', nargs='*', metavar='G1.json G2.json out.bin')
+    generate = commands.add_parser('generate', help="generate an INSECURE setup from a known secret")
+    generate.add_argument('--size', type=int, default=8192, help="number of G1 powers")
+    generate.add_argument('--g2-size', type=int, help="number of G2 powers (default: --size)")
+    generate.add_argument('--secret', type=int, default=7851823980)
+    generate.add_argument('--method', choices=['fixed-base', 'successive'], default='fixed-base')
+    generate.add_argument('--workers', type=int, default=os.cpu_count())
+    generate.add_argument('--format', choices=['binary', 'json'], default='binary')
+    # No default: the files next to this one are the setup that SETUP loads
+    generate.add_argument('--output', required=True, help="binary file, or directory of the JSON files")
+    lagrange = commands.add_parser('lagrange', help="precompute the Lagrange form of the setup for some domain sizes")
+    lagrange.add_argument('--sizes', type=int, nargs='+', help="domain sizes (default: the size of a blob)")
+    lagrange.add_argument('--output', help="directory of the files (default: next to this file)")
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        convert_json_to_binary(*args.paths[:3])
+    elif args.command == 'generate':
+        # The JSON format holds one extra power, which load_json_setup() drops
+        extra = 1 if args.format == 'json' else 0
+        g2_size = args.g2_size if args.g2_size is not None else args.size
+        setup = generate_setup(args.size + extra, args.secret, g2_size + extra, args.method, args.workers)
+        if args.format == 'json':
+            write_json_setup(setup, os.path.join(args.output, 'trusted_setup_G1.json'), os.path.join(args.output, 'trusted_setup_G2.json'))
+        else:
+            write_binary_setup(setup, args.output)
+    elif args.command == 'lagrange':
+        from imported.kzg_proofs import LagrangeSetupCache
+        import params
+        # Files in SETUP_DIR are picked up by kzg_proofs.LAGRANGE_SETUP_CACHE
+        cache = LagrangeSetupCache(0, args.output or SETUP_DIR)
+        for size in args.sizes or [params.FIELD_ELEMENTS_PER_BLOB]:
+            cache.get(SETUP, size)
+    else:
+        parser.print_help()
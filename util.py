@@ -1,13 +1,24 @@
 from py_ecc import optimized_bls12_381 as b
 
 from trusted_setup import SETUP
-from imported.kzg_proofs import is_power_of_two, get_root_of_unity
-import multicombs
+from imported.kzg_proofs import is_power_of_two, get_root_of_unity, reverse_bit_order, list_to_reverse_bit_order
+from domain import get_domain
+import msm
+from field import FieldVector
 
 MODULUS = b.curve_order
 
 def lincomb(points, scalars):
-    return multicombs.lincomb(points, scalars, b.add, b.Z1)
+    return msm.lincomb(points, scalars)
+
+def normalize(point):
+    """
+    Canonical projective representation of a G1 point: z = 1, or b.Z1 for the point at infinity
+    """
+    if b.is_inf(point):
+        return b.Z1
+    x, y = b.normalize(point)
+    return (x, y, b.FQ.one())
 
 def vector_lincomb(vectors, scalars):
     """
@@ -17,25 +28,12 @@ def vector_lincomb(vectors, scalars):
     r = [0]*len(vectors[0])
     for v, a in zip(vectors, scalars):
         for i, x in enumerate(v):
-            r[i] = (r[i] + a * x) % MODULUS
-    return [BLSFieldElement(x) for x in r]
-
-def reverse_bit_order(n, order):
-    """
-    Reverse the bit order of an integer n
-    """
-    assert is_power_of_two(order)
-    # Convert n to binary with the same number of bits as "order" - 1, then reverse its bit order
-    return int(('{:0' + str(order.bit_length() - 1) + 'b}').format(n)[::-1], 2)
-
+            r[i] += a * x
+    # Reduce once per column rather than after every multiply-add
+    return FieldVector([x % MODULUS for x in r])
 
-def list_to_reverse_bit_order(l):
+def get_coset_factor(j, N_locs):
     """
-    Convert a list between normal and reverse bit order. This operation is idempotent.
+    Shift factor of the coset holding sample j of N_locs elements, in the setup-sized domain
     """
-    return [l[reverse_bit_order(i, len(l))] for i in range(len(l))]
-
-def get_coset_factor(j, N_locs):
-    order = len(SETUP[0])
-    root = get_root_of_unity(order)
-    return pow(root, list_to_reverse_bit_order(range(order))[N_locs * j], MODULUS)
+    return get_domain(len(SETUP[0])).coset_factor(j, N_locs)
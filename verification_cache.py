@@ -0,0 +1,114 @@
+# Cache of sample verification results.
+#
+# The same sample is often verified several times (gossip duplicates, re-requests, several
+# subsystems checking it). A result is keyed by everything the check depends on: the commitment,
+# the sample index, a hash of the data and the proof. So a hit is exactly as good as verifying.
+
+import collections, hashlib, time
+
+from py_ecc import optimized_bls12_381 as b
+
+
+def point_key(point):
+    """Hashable affine coordinates of a G1 point (None for the point at infinity)"""
+    if b.is_inf(point):
+        return None
+    x, y, z = point
+    if z != b.FQ.one():
+        x, y = b.normalize(point)
+    return (x.n, y.n)
+
+
+def sample_key(sample, commitment):
+    """Cache key of verifying `sample` against `commitment`"""
+    # The compressed encoding of a point is unique, so the proof's encoding can be used as is
+    return (point_key(commitment), sample.sample_index, hashlib.sha256(sample.data).digest(), bytes(sample.proof))
+
+
+class LRUEviction(object):
+    """Evict the least recently used entry"""
+    def __init__(self):
+        self.order = collections.OrderedDict()
+
+    def insert(self, key):
+        self.order[key] = None
+
+    def touch(self, key):
+        self.order.move_to_end(key)
+
+    def remove(self, key):
+        del self.order[key]
+
+    def evict(self):
+        key, _ = self.order.popitem(last=False)
+        return key
+
+
+class FIFOEviction(LRUEviction):
+    """Evict the oldest entry, however often it is used"""
+    def touch(self, key):
+        pass
+
+
+class VerificationCache(object):
+    """
+    Verification results, at most `max_entries` of them, each valid for `ttl` seconds (forever if
+    None).
+
+    `eviction` decides which entry goes when the cache is full. It is any object with insert(key),
+    touch(key), remove(key) and evict() -> key methods; LRUEviction by default.
+    """
+    def __init__(self, max_entries=65536, ttl=None, eviction=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.eviction = eviction if eviction is not None else LRUEviction()
+        self.clock = clock
+        self.entries = {}
+        self.stats = collections.Counter()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """The cached result for `key`, or None"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        result, expires = entry
+        if expires is not None and self.clock() >= expires:
+            self._remove(key)
+            self.stats['expirations'] += 1
+            self.stats['misses'] += 1
+            return None
+        self.eviction.touch(key)
+        self.stats['hits'] += 1
+        return result
+
+    def put(self, key, result):
+        if key in self.entries:
+            self._remove(key)
+        expires = self.clock() + self.ttl if self.ttl is not None else None
+        self.entries[key] = (result, expires)
+        self.eviction.insert(key)
+        while len(self.entries) > self.max_entries:
+            del self.entries[self.eviction.evict()]
+            self.stats['evictions'] += 1
+
+    def _remove(self, key):
+        del self.entries[key]
+        self.eviction.remove(key)
+
+    def clear(self):
+        for key in list(self.entries):
+            self._remove(key)
+
+    def get_sample(self, sample, commitment):
+        return self.get(sample_key(sample, commitment))
+
+    def put_sample(self, sample, commitment, result):
+        self.put(sample_key(sample, commitment), result)
+
+    def hit_rate(self):
+        lookups = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / lookups if lookups else 0.0
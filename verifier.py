@@ -0,0 +1,179 @@
+# Asynchronous sample verification for nodes running an asyncio event loop.
+#
+#   async with AsyncVerifier(executor=make_executor(4)) as verifier:
+#       ok = await verifier.verify(sample, commitment)
+#
+# Requests are queued and grouped into micro-batches: a batch is sent off as soon as it is full or
+# `batch_window` seconds after its first request. Batches are checked with a single aggregated
+# pairing check (verify_samples_batch) in the executor, so the event loop never runs any crypto.
+
+import asyncio, collections
+
+from sharding import verify_samples_batch, find_invalid_samples
+
+
+def _verify_one(sample, commitment):
+    try:
+        return verify_samples_batch([(sample, commitment)])
+    except ValueError:
+        # Points that are not on the curve
+        return False
+    except Exception as e:
+        return e
+
+def verify_batch(samples_with_commitments):
+    """
+    Verify a list of (sample, commitment) pairs, returning one bool per pair. Failing batches are
+    bisected to find the invalid samples.
+
+    If checking the batch raises, the samples are checked one by one, so that only the offending
+    sample fails: it gets False for a ValueError (a malformed proof or commitment), and the exception
+    itself otherwise.
+    """
+    try:
+        invalid = set(find_invalid_samples(samples_with_commitments))
+    except Exception:
+        return [_verify_one(sample, commitment) for sample, commitment in samples_with_commitments]
+    return [i not in invalid for i in range(len(samples_with_commitments))]
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q / 100))]
+
+
+class AsyncVerifier(object):
+    """
+    Micro-batching verification front-end.
+
+    `executor` is where batches are verified: a process pool such as sharding.make_executor() to use
+    several cores, or None for the event loop's default thread pool. At most `max_in_flight` batches
+    of up to `max_batch` samples are verified at a time. Once `max_queue` requests are waiting,
+    verify() blocks until there is room, which pushes back on whoever is feeding samples in.
+
+    With a `cache` (a VerificationCache), samples with a cached result are answered right away and
+    never queued.
+    """
+    def __init__(self, executor=None, max_batch=64, batch_window=0.005, max_queue=1024, max_in_flight=4,
+                 latency_window=4096, cache=None):
+        self.executor = executor
+        self.cache = cache
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.max_queue = max_queue
+        self.max_in_flight = max_in_flight
+        self.queue = None
+        self.latencies = collections.deque(maxlen=latency_window)
+        self.counts = collections.Counter()
+        self.max_queue_depth = 0
+        self._dispatcher = None
+        self._in_flight = None
+        self._batches = set()
+
+    async def start(self):
+        assert self._dispatcher is None, "already started"
+        self.queue = asyncio.Queue(self.max_queue)
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+    async def close(self):
+        """Verify everything still queued, then stop"""
+        if self._dispatcher is None:
+            return
+        await self.queue.join()
+        self._dispatcher.cancel()
+        try:
+            await self._dispatcher
+        except asyncio.CancelledError:
+            pass
+        self._dispatcher = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def verify(self, sample, commitment):
+        """True iff the sample's multiproof verifies against the commitment"""
+        assert self._dispatcher is not None, "verifier is not started"
+        if self.cache is not None:
+            ok = self.cache.get_sample(sample, commitment)
+            if ok is not None:
+                self.counts['cached'] += 1
+                return ok
+        loop = asyncio.get_running_loop()
+        result = loop.create_future()
+        await self.queue.put((sample, commitment, result, loop.time()))
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return await result
+
+    async def _next_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.batch_window
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _dispatch(self):
+        while True:
+            batch = await self._next_batch()
+            await self._in_flight.acquire()
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, verify_batch,
+                                                 [(sample, commitment) for sample, commitment, _, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        finally:
+            self._in_flight.release()
+
+        now = loop.time()
+        self.counts['batches'] += 1
+        for (sample, commitment, future, enqueued), ok in zip(batch, results):
+            self.latencies.append(now - enqueued)
+            if isinstance(ok, Exception):
+                self.counts['errors'] += 1
+                if not future.done():
+                    future.set_exception(ok)
+            else:
+                self.counts['valid' if ok else 'invalid'] += 1
+                if self.cache is not None:
+                    self.cache.put_sample(sample, commitment, ok)
+                if not future.done():
+                    future.set_result(ok)
+            self.queue.task_done()
+
+    def stats(self):
+        """Request counts, batch sizes, queue depth and latency percentiles (in seconds)"""
+        latencies = sorted(self.latencies)
+        verified = self.counts['valid'] + self.counts['invalid'] + self.counts['errors']
+        return {
+            'valid': self.counts['valid'],
+            'invalid': self.counts['invalid'],
+            'errors': self.counts['errors'],
+            'cached': self.counts['cached'],
+            'batches': self.counts['batches'],
+            'mean_batch_size': verified / self.counts['batches'] if self.counts['batches'] else 0.0,
+            'queue_depth': self.queue.qsize() if self.queue is not None else 0,
+            'max_queue_depth': self.max_queue_depth,
+            'batches_in_flight': len(self._batches),
+            'latency_p50': _percentile(latencies, 50),
+            'latency_p90': _percentile(latencies, 90),
+            'latency_p99': _percentile(latencies, 99),
+            'latency_max': latencies[-1] if latencies else 0.0,
+        }